@@ -0,0 +1,727 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_jsonte
+----------------------------------
+
+Benchmarks for `jsonte` module.
+
+Run ``python bench_jsonte.py`` to run all benchmarks, or ``python bench_jsonte.py <name> ...`` for selected ones.
+``python bench_jsonte.py suite --output results.json`` runs just the suite of dumps and loads benchmarks over the
+synthetic corpora, saving the results so that runs before and after a change can be compared.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import decimal
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import dateutil.parser
+import dateutil.tz
+
+import jsonte
+
+BENCHMARKS = list()  # list of tuples ( name , function that runs the benchmark )
+
+
+def benchmark(func):
+    BENCHMARKS.append((func.__name__[len('bench_'):], func))
+    return func
+
+
+def best_of(func, number, repeat):
+    """ Return the best time per call of func, in seconds """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+# noinspection PyUnusedLocal
+def _dummy_serialiser(obj):
+    dct = jsonte.SerialisationDict()
+    dct[u'#dummy'] = u''
+    return dct
+
+
+@benchmark
+def bench_dispatch(args):
+    """ per-object cost of _JsonteEncoder.default as the number of registered types grows """
+    print('%10s %15s %15s' % ('types', 'default (us)', 'linear (us)'))
+    for type_count in (5, 20, 50, 100, 200):
+        serialiser = jsonte.JsonteSerialiser()
+        for i in range(type_count - len(serialiser.get_type_classes())):
+            serialiser.add_type_serialiser(type('Dummy%d' % i, (object,), {}), _dummy_serialiser)
+        serialiser.finalise_serialisers()
+        # noinspection PyProtectedMember
+        encoder = jsonte._JsonteEncoder(serialiser)
+        objs = [datetime.datetime(2015, 5, 28, 22, 13, 42), datetime.date(2015, 5, 28)] * 50
+
+        def run_default():
+            for obj in objs:
+                encoder.default(obj)
+
+        # the standard types were sorted in with the added ones, so could be anywhere in the list - the worst case is
+        # after all of them (they are now kept first, which would hide the cost of the scan)
+        # noinspection PyProtectedMember
+        standard_classes = set(cls for cls, func in jsonte._STANDARD_SERIALISERS)
+        # noinspection PyProtectedMember
+        serialisers = sorted(serialiser._registry.serialisers, key=lambda item: item[0] in standard_classes)
+
+        def run_linear():
+            # the isinstance scan that default used to do
+            for obj in objs:
+                for cls, func in serialisers:
+                    if isinstance(obj, cls):
+                        func(obj)
+                        break
+
+        default_time = best_of(run_default, args.number, args.repeat) / len(objs)
+        linear_time = best_of(run_linear, args.number, args.repeat) / len(objs)
+        print('%10d %15.3f %15.3f' % (type_count, default_time * 1e6, linear_time * 1e6))
+
+
+def plain_rows_json(size_mb):
+    """ A json array of mostly plain rows (1 in 100 has a timestamp) of at least size_mb megabytes """
+    rnd = random.Random(1)
+    chunks = list()
+    size = 0
+    i = 0
+    while size < size_mb * 1024 * 1024:
+        row = {u'id': i, u'name': u'user %d' % i, u'email': u'u%d@example.com' % i, u'active': i % 2 == 0,
+               u'score': rnd.random(), u'tags': [u'a', u'b', u'c'],
+               u'address': {u'street': u'%d Main St' % i, u'city': u'Springfield', u'zip': u'%05d' % i}}
+        if i % 100 == 0:
+            row[u'created'] = {u'#tstamp': u'2015-05-28T22:13:42'}
+        chunk = json.dumps(row)
+        chunks.append(chunk)
+        size += len(chunk) + 2
+        i += 1
+    return u'[' + u', '.join(chunks) + u']'
+
+
+@benchmark
+def bench_objecthook(args):
+    """ loads of a mostly plain document, against json.loads """
+    doc = plain_rows_json(args.size)
+    serialiser = jsonte.JsonteSerialiser()
+    json_time = best_of(lambda: json.loads(doc), 1, args.repeat)
+    jsonte_time = best_of(lambda: serialiser.loads(doc), 1, args.repeat)
+    print('%.1f MB: json.loads %.3fs, jsonte loads %.3fs (overhead %.3fs)'
+          % (len(doc) / 1e6, json_time, jsonte_time, jsonte_time - json_time))
+
+
+@benchmark
+def bench_small_dumps(args):
+    """ dumps throughput on small objects, against building a new encoder for every call """
+    serialiser = jsonte.JsonteSerialiser()
+    obj = {u'id': 1, u'name': u'widget', u'price': decimal.Decimal('12.50')}
+
+    def run_new_encoder():
+        # noinspection PyProtectedMember
+        jsonte._JsonteEncoder(serialiser, skipkeys=serialiser.skipkeys, ensure_ascii=serialiser.ensure_ascii,
+                              check_circular=serialiser.check_circular, allow_nan=serialiser.allow_nan,
+                              indent=serialiser.indent, separators=serialiser.separators,
+                              sort_keys=serialiser.sort_keys).encode(obj)
+
+    number = args.number * 100
+    dumps_time = best_of(lambda: serialiser.dumps(obj), number, args.repeat)
+    new_encoder_time = best_of(run_new_encoder, number, args.repeat)
+    print('dumps: %.0f/s, new encoder per call: %.0f/s' % (1 / dumps_time, 1 / new_encoder_time))
+
+
+@benchmark
+def bench_timestamps(args):
+    """ decode throughput of #tstamp values, against parsing them with dateutil """
+    base = datetime.datetime(2015, 5, 28, 22, 13, 42, 381000)
+    tzinfos = [None, dateutil.tz.tzoffset(None, 36000), dateutil.tz.tzoffset(None, -19800)]
+    texts = [(base + datetime.timedelta(seconds=i * 7)).replace(tzinfo=tzinfos[i % 3]).isoformat()
+             for i in range(args.count)]
+    doc = json.dumps([{u'#tstamp': text} for text in texts])
+    serialiser = jsonte.JsonteSerialiser()
+    loads_time = best_of(lambda: serialiser.loads(doc), 1, args.repeat)
+    dateutil_time = best_of(lambda: [dateutil.parser.parse(text) for text in texts], 1, min(args.repeat, 2))
+    print('%d timestamps: loads %.0f/s, dateutil.parser.parse alone %.0f/s'
+          % (args.count, args.count / loads_time, args.count / dateutil_time))
+
+
+class NullWriter(object):
+    def write(self, data):
+        pass
+
+
+def peak_memory(func):
+    """ Return the peak memory allocated (in bytes) while running func """
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def nested_doc(key_count, depth=10, width=10):
+    """ A list of records nested depth levels deep, each level having width keys, two of them needing escaping """
+    records = list()
+    for i in range(key_count // (depth * width)):
+        record = None
+        for level in range(depth):
+            dct = {u'#id': i, u'~level': level}
+            for j in range(width - 3):
+                dct[u'key%d' % j] = j
+            dct[u'child'] = record
+            record = dct
+        records.append(record)
+    return records
+
+
+def escaped_copy(obj, escape_char=u'~', chars_to_escape=u'#~'):
+    """ escaping by copying every dict, for comparison """
+    if isinstance(obj, dict):
+        return dict((escape_char + key if key[:1] and key[0] in chars_to_escape else key, escaped_copy(value))
+                    for key, value in obj.items())
+    elif isinstance(obj, list):
+        return [escaped_copy(value) for value in obj]
+    return obj
+
+
+@benchmark
+def bench_escape_memory(args):
+    """ peak memory of dump for nested documents needing keys escaped, against escaping by copying """
+    serialiser = jsonte.JsonteSerialiser()
+    print('%10s %15s %15s' % ('keys', 'dump (KB)', 'copying (KB)'))
+    for key_count in (10000, 100000, 1000000):
+        doc = nested_doc(key_count)
+        dump_peak = peak_memory(lambda: serialiser.dump(doc, NullWriter()))
+        copy_peak = peak_memory(lambda: json.dump(escaped_copy(doc), NullWriter()))
+        print('%10d %15.1f %15.1f' % (key_count, dump_peak / 1024.0, copy_peak / 1024.0))
+
+
+class GeneratedArrayFile(object):
+    """ A read-only file with a json array of item_count copies of item_json, generated as it is read """
+    def __init__(self, item_json, item_count):
+        self.item_json = item_json
+        self.remaining = item_count
+        self.pending = u'['
+
+    def read(self, size=-1):
+        if size < 0:
+            data = self.pending + u', '.join([self.item_json] * self.remaining) + u']'
+            self.pending, self.remaining = u'', 0
+            return data
+        while len(self.pending) < size and self.remaining:
+            self.remaining -= 1
+            self.pending += self.item_json + (u', ' if self.remaining else u']')
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+@benchmark
+def bench_iterload(args):
+    """ time and peak memory of iterload on a generated array, against load """
+    serialiser = jsonte.JsonteSerialiser()
+    item_json = serialiser.dumps({u'id': 1, u'when': datetime.datetime(2015, 5, 28, 22, 13, 42),
+                                  u'cost': decimal.Decimal('12.50'), u'name': u'x' * 200})
+    item_count = int(args.size * 1024 * 1024) // (len(item_json) + 2)
+    results = dict()
+
+    def run_iterload():
+        start = timeit.default_timer()
+        for item in serialiser.iterload(GeneratedArrayFile(item_json, item_count)):
+            pass
+        results['iterload'] = timeit.default_timer() - start
+
+    def run_load():
+        start = timeit.default_timer()
+        serialiser.load(GeneratedArrayFile(item_json, item_count))
+        results['load'] = timeit.default_timer() - start
+
+    iterload_peak = peak_memory(run_iterload)
+    load_peak = peak_memory(run_load)
+    print('%.0f MB: iterload %.2fs peak %.1f MB, load %.2fs peak %.1f MB (times include tracemalloc overhead)'
+          % (args.size, results['iterload'], iterload_peak / 1e6, results['load'], load_peak / 1e6))
+
+
+@benchmark
+def bench_lines(args):
+    """ dump_lines and load_lines records/s, against a dumps/loads per line loop """
+    import io
+    serialiser = jsonte.JsonteSerialiser()
+    records = [{u'id': i, u'when': datetime.datetime(2015, 5, 28, 22, 13, i % 60), u'cost': decimal.Decimal(i),
+                u'name': u'record %d' % i} for i in range(args.count)]
+
+    def run_dump_lines():
+        serialiser.dump_lines(records, io.StringIO())
+
+    def run_dumps_loop():
+        fp = io.StringIO()
+        for record in records:
+            fp.write(serialiser.dumps(record) + u'\n')
+
+    fp = io.StringIO()
+    serialiser.dump_lines(records, fp)
+    text = fp.getvalue()
+
+    def run_load_lines():
+        for record in serialiser.load_lines(io.StringIO(text)):
+            pass
+
+    def run_loads_loop():
+        for line in io.StringIO(text):
+            serialiser.loads(line)
+
+    for name, func in (('dump_lines', run_dump_lines), ('dumps per line', run_dumps_loop),
+                       ('load_lines', run_load_lines), ('loads per line', run_loads_loop)):
+        print('%15s: %.0f records/s' % (name, args.count / best_of(func, 1, args.repeat)))
+
+
+@benchmark
+def bench_workers(args):
+    """ dumps_many and loads_many rows/s with 1, 2, 4 and 8 worker processes """
+    serialiser = jsonte.JsonteSerialiser()
+    rows = [{u'id': i, u'when': datetime.datetime(2015, 5, 28, 22, 13, i % 60), u'cost': decimal.Decimal(i),
+             u'name': u'row %d' % i, u'tags': [u'a', u'b']} for i in range(args.count)]
+    strings = serialiser.dumps_many(rows, workers=1)
+    print('%10s %18s %18s' % ('workers', 'dumps_many rows/s', 'loads_many rows/s'))
+    for workers in (1, 2, 4, 8):
+        dumps_time = best_of(lambda: serialiser.dumps_many(rows, workers=workers, chunksize=1024), 1, args.repeat)
+        loads_time = best_of(lambda: serialiser.loads_many(strings, workers=workers, chunksize=1024), 1, args.repeat)
+        print('%10d %18.0f %18.0f' % (workers, args.count / dumps_time, args.count / loads_time))
+
+
+@benchmark
+def bench_threads(args):
+    """ dumps and loads rows/s from 1, 2, 4, 8 and 16 threads sharing one serialiser """
+    import threading
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    print('GIL: %s' % ('enabled' if is_gil_enabled is None or is_gil_enabled() else 'disabled (free-threaded)'))
+    serialiser = jsonte.JsonteSerialiser()
+    rows = [{u'id': i, u'when': datetime.datetime(2015, 5, 28, 22, 13, i % 60), u'cost': decimal.Decimal(i),
+             u'name': u'row %d' % i, u'tags': [u'a', u'b']} for i in range(100)]
+    jsonte_str = serialiser.dumps(rows)
+    rounds = max(1, args.count // len(rows))
+
+    def run(thread_count, func):
+        threads = [threading.Thread(target=lambda: [func() for i in range(rounds // thread_count)])
+                   for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print('%10s %18s %18s' % ('threads', 'dumps rows/s', 'loads rows/s'))
+    for thread_count in (1, 2, 4, 8, 16):
+        row_count = rounds // thread_count * thread_count * len(rows)
+        dumps_time = best_of(lambda: run(thread_count, lambda: serialiser.dumps(rows)), 1, args.repeat)
+        loads_time = best_of(lambda: run(thread_count, lambda: serialiser.loads(jsonte_str)), 1, args.repeat)
+        print('%10d %18.0f %18.0f' % (thread_count, row_count / dumps_time, row_count / loads_time))
+
+
+@benchmark
+def bench_binary_memory(args):
+    """ peak memory (beyond the blob itself) of dumps and loads of a --size MB blob """
+    import base64
+    blob = bytearray(random.Random(1).getrandbits(8) for i in range(1024)) * int(args.size * 1024)
+    serialiser = jsonte.JsonteSerialiser()
+
+    def legacy_dumps():
+        # what binary_serialiser used to do, with dumps of the result
+        json.dumps({u'#bin': base64.b64encode(bytes(blob)).decode('ascii')})
+
+    for name, func in ((u'dumps (old serialiser)', legacy_dumps),
+                       (u'dumps bytearray', lambda: serialiser.dumps(blob)),
+                       (u'dumps memoryview', lambda: serialiser.dumps(memoryview(blob)))):
+        print('%25s: %.1f MB' % (name, peak_memory(func) / 1e6))
+    jsonte_str = serialiser.dumps(blob)
+
+    def legacy_loads():
+        # what binary_deserialiser used to do
+        bytearray(base64.b64decode(json.loads(jsonte_str)[u'#bin']))
+
+    print('%25s: %.1f MB' % (u'loads (old deserialiser)', peak_memory(legacy_loads) / 1e6))
+    for binary_type in ('bytearray', 'bytes', 'memoryview'):
+        serialiser = jsonte.JsonteSerialiser(binary_type=binary_type)
+        print('%25s: %.1f MB' % (u'loads ' + binary_type, peak_memory(lambda: serialiser.loads(jsonte_str)) / 1e6))
+
+
+@benchmark
+def bench_binary_stream(args):
+    """ time and peak memory (beyond the blob itself) of dump of a --size MB blob, against dumps """
+    blob = bytearray(random.Random(1).getrandbits(8) for i in range(1024)) * int(args.size * 1024)
+    serialiser = jsonte.JsonteSerialiser()
+    for name, func in ((u'dump', lambda: serialiser.dump({u'attachment': blob}, NullWriter())),
+                       (u'dumps', lambda: serialiser.dumps({u'attachment': blob}))):
+        print('%10s: %.2fs, peak %.1f MB' % (name, best_of(func, 1, args.repeat), peak_memory(func) / 1e6))
+
+
+@benchmark
+def bench_engines(args):
+    """ dumps with each engine, for plain, type heavy and escape heavy documents of around --size MB """
+    rows = jsonte.JsonteSerialiser().loads(plain_rows_json(args.size))
+    typed_rows = [dict(row, score=decimal.Decimal(repr(row[u'score'])), created=datetime.datetime(2015, 5, 28, i % 24),
+                       avatar=bytearray(b'\x89PNG')) for i, row in enumerate(rows)]
+    docs = [(u'plain', rows), (u'typed', typed_rows), (u'escaped', nested_doc(len(rows) * 10))]
+    # noinspection PyProtectedMember
+    engines = sorted(jsonte._ENGINES)
+    print('%10s' % '' + ''.join('%14s' % engine for engine in engines))
+    for doc_name, doc in docs:
+        times = list()
+        for engine in engines:
+            serialiser = jsonte.JsonteSerialiser(engine=engine)
+            times.append(best_of(lambda: serialiser.dumps(doc), 1, args.repeat))
+        print('%10s' % doc_name + ''.join('%13.3fs' % t for t in times))
+
+
+# ---- suite of encode and decode benchmarks over synthetic corpora, with plain json as the baseline
+
+CORPORA = list()  # list of tuples ( name , function that returns a list of records given a count and random.Random )
+
+
+def corpus(func):
+    CORPORA.append((func.__name__[len('corpus_'):], func))
+    return func
+
+
+@corpus
+def corpus_wide(count, rnd):
+    """ flat rows of 40 plain columns """
+    return [dict([(u'int%d' % j, rnd.randint(0, 10 ** 6)) for j in range(10)] +
+                 [(u'float%d' % j, rnd.random()) for j in range(10)] +
+                 [(u'str%d' % j, u'value %d' % rnd.randint(0, 1000)) for j in range(10)] +
+                 [(u'flag%d' % j, rnd.random() < 0.5 if j % 2 else None) for j in range(10)])
+            for i in range(count)]
+
+
+@corpus
+def corpus_nested(count, rnd):
+    """ documents nested 20 levels deep """
+    records = list()
+    for i in range(count):
+        record = {u'leaf': i}
+        for level in range(20):
+            record = {u'level': level, u'items': [rnd.randint(0, 100), u'x'], u'child': record}
+        records.append(record)
+    return records
+
+
+@corpus
+def corpus_timestamps(count, rnd):
+    """ rows of naive and timezone aware timestamps, dates and times """
+    base = datetime.datetime(2015, 5, 28, 22, 13, 42, 381000)
+    tzinfos = [dateutil.tz.tzutc(), dateutil.tz.tzoffset(None, 36000), dateutil.tz.tzoffset(None, -19800)]
+    rows = list()
+    for i in range(count):
+        when = base + datetime.timedelta(seconds=rnd.randint(0, 10 ** 8))
+        rows.append({u'id': i, u'created': when, u'updated': when.replace(tzinfo=tzinfos[i % 3]),
+                     u'day': when.date(), u'at': when.time()})
+    return rows
+
+
+@corpus
+def corpus_decimals(count, rnd):
+    """ rows of 10 Decimal columns """
+    return [dict((u'amount%d' % j, decimal.Decimal(rnd.randint(-10 ** 8, 10 ** 8)).scaleb(-2)) for j in range(10))
+            for i in range(count)]
+
+
+@corpus
+def corpus_binary(count, rnd):
+    """ rows with a 1 to 4 KB binary payload """
+    blob = bytearray(rnd.getrandbits(8) for i in range(4096))
+    return [{u'id': i, u'payload': blob[:rnd.randint(1024, 4096)]} for i in range(count)]
+
+
+@corpus
+def corpus_escaped(count, rnd):
+    """ rows where most keys start with # or ~, so need escaping """
+    return [dict([(u'#tag%d' % j, rnd.randint(0, 100)) for j in range(5)] +
+                 [(u'~note%d' % j, {u'#ref': j}) for j in range(5)] + [(u'id', i)])
+            for i in range(count)]
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100.0))]
+
+
+def measure(func, whole, items, repeat):
+    """
+    Return (time, latencies, peak) - the best time of func(whole), the sorted times of func on each of items (up to
+    10000 of them) and the peak memory allocated by func(whole).
+    """
+    whole_time = best_of(lambda: func(whole), 1, repeat)
+    timer = timeit.default_timer
+    latencies = list()
+    for item in items[:10000]:
+        start = timer()
+        func(item)
+        latencies.append(timer() - start)
+    latencies.sort()
+    return whole_time, latencies, peak_memory(lambda: func(whole))
+
+
+@benchmark
+def bench_suite(args):
+    """ dumps and loads of each corpus (--records rows), against json on the equivalent plain json documents """
+    serialiser = jsonte.JsonteSerialiser()
+    results = list()
+    print('%10s %6s %7s %9s %9s %9s %9s' % ('corpus', 'op', 'lib', 'MB/s', 'p50 us', 'p99 us', 'peak MB'))
+    for corpus_name, corpus_func in CORPORA:
+        if args.corpora and corpus_name not in args.corpora:
+            continue
+        records = corpus_func(args.records, random.Random(1))
+        text = serialiser.dumps(records)
+        texts = [serialiser.dumps(record) for record in records]
+        plain_records = json.loads(text)  # the jsonte documents as json sees them, so json does the same work
+        for op, lib, func, whole, items in ((u'dumps', u'json', json.dumps, plain_records, plain_records),
+                                            (u'dumps', u'jsonte', serialiser.dumps, records, records),
+                                            (u'loads', u'json', json.loads, text, texts),
+                                            (u'loads', u'jsonte', serialiser.loads, text, texts)):
+            whole_time, latencies, peak = measure(func, whole, items, args.repeat)
+            result = dict(corpus=corpus_name, op=op, lib=lib, mb_per_s=len(text) / whole_time / 1e6,
+                          p50_us=percentile(latencies, 50) * 1e6, p99_us=percentile(latencies, 99) * 1e6,
+                          peak_mb=peak / 1e6)
+            results.append(result)
+            print('%(corpus)10s %(op)6s %(lib)7s %(mb_per_s)9.1f %(p50_us)9.1f %(p99_us)9.1f %(peak_mb)9.1f' % result)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(dict(records=args.records, repeat=args.repeat, results=results), fp, indent=1, sort_keys=True)
+
+
+@benchmark
+def bench_stats(args):
+    """ dumps and loads of the timestamps corpus (--records rows) without stats, and with stats at various sampling """
+    serialiser = jsonte.JsonteSerialiser()
+    records = corpus_timestamps(args.records, random.Random(1))
+    text = serialiser.dumps(records)
+    print('%15s %10s %10s' % ('stats', 'dumps', 'loads'))
+    for sample_every in (None, 1, 10, 100):
+        if sample_every is None:
+            serialiser.disable_stats()
+        else:
+            serialiser.enable_stats(sample_every)
+        dumps_time = best_of(lambda: serialiser.dumps(records), 1, args.repeat)
+        loads_time = best_of(lambda: serialiser.loads(text), 1, args.repeat)
+        print('%15s %9.3fs %9.3fs' % ('off' if sample_every is None else 'sample 1/%d' % sample_every,
+                                      dumps_time, loads_time))
+
+
+@benchmark
+def bench_cache(args):
+    """ loads of --count rows of repeated dates, decimals and timestamps, without and with the deserialiser caches """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    text = serialiser.dumps([{u'day': datetime.date(2015, 1, 1) + datetime.timedelta(days=rnd.randint(0, 365)),
+                              u'price': decimal.Decimal(rnd.randint(0, 1000)).scaleb(-2),
+                              u'hour': datetime.datetime(2015, 5, 28, rnd.randint(0, 23), tzinfo=dateutil.tz.tzutc())}
+                             for i in range(args.count)])
+    print('%25s %10s' % ('cache', 'loads'))
+    for maxsize in (None, 100, 4096):
+        if maxsize is None:
+            serialiser.disable_cache()
+        else:
+            serialiser.enable_cache(maxsize=maxsize)
+        loads_time = best_of(lambda: serialiser.loads(text), 1, args.repeat)
+        print('%25s %9.3fs' % ('off' if maxsize is None else 'maxsize %d' % maxsize, loads_time))
+        for name, info in sorted(serialiser.cache_info().items()):
+            if info['hits'] or info['misses']:
+                print('%25s hit rate %.3f, %d evictions' % (name, info['hit_rate'], info['evictions']))
+
+
+@benchmark
+def bench_lazy(args):
+    """ loads of --count records, then reading some of each one's fields, eagerly and with lazy=True """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    text = serialiser.dumps([{u'id': i, u'name': u'user %d' % i,
+                              u'created': datetime.datetime(2015, 5, 28, 22, 13, 42) + datetime.timedelta(seconds=i),
+                              u'updated': datetime.datetime(2016, 5, 28, 22, 13, 42) + datetime.timedelta(seconds=i),
+                              u'day': datetime.date(2015, 1, 1) + datetime.timedelta(days=i % 365),
+                              u'price': decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2),
+                              u'cost': decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2),
+                              u'thumbnail': bytearray(rnd.getrandbits(8) for j in range(1024))}
+                             for i in range(args.count)])
+    print('%25s %10s %10s %10s' % ('fields read', 'eager', 'lazy', 'speedup'))
+    for fields in ([], [u'id'], [u'id', u'price'], [u'id', u'price', u'created', u'thumbnail'],
+                   [u'id', u'name', u'created', u'updated', u'day', u'price', u'cost', u'thumbnail']):
+        def run(lazy):
+            for record in serialiser.loads(text, lazy=lazy):
+                for field in fields:
+                    record[field]
+
+        eager_time = best_of(lambda: run(False), 1, args.repeat)
+        lazy_time = best_of(lambda: run(True), 1, args.repeat)
+        label = u','.join(fields) or u'none' if len(fields) < 5 else u'all'
+        print('%25s %9.3fs %9.3fs %9.1fx' % (label, eager_time, lazy_time, eager_time / lazy_time))
+
+
+@benchmark
+def bench_forward(args):
+    """ gateway style patch and forward of --count messages, each with a payload of timestamps, decimals and binary """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    messages = list()
+    for i in range(args.count):
+        created = datetime.datetime(2015, 5, 28, 22, 13, 42, tzinfo=dateutil.tz.tzutc())
+        payload = {u'rows': [{u'created': created + datetime.timedelta(seconds=j),
+                              u'price': decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2), u'#id': j}
+                             for j in range(20)],
+                   u'attachment': bytearray(rnd.getrandbits(8) for j in range(4096))}
+        messages.append(serialiser.dumps({u'id': i, u'route': [u'in'], u'payload': payload}))
+
+    def forward(**kwargs):
+        for message in messages:
+            data = serialiser.loads(message, **kwargs)
+            data[u'route'] = [u'in', u'gateway']
+            serialiser.dumps(data)
+
+    total_mb = sum(len(message) for message in messages) / 1e6
+    for name, kwargs in ((u'loads and dumps', dict()), (u'lazy', dict(lazy=True)),
+                         (u'raw payload', dict(raw_paths=[[u'payload']]))):
+        elapsed = best_of(lambda: forward(**kwargs), 1, args.repeat)
+        print('%20s: %.3fs, %.0f messages/s, %.1f MB/s' % (name, elapsed, args.count / elapsed, total_mb / elapsed))
+
+
+@benchmark
+def bench_setup(args):
+    """ import time of jsonte (in a new interpreter, best of --repeat), and JsonteSerialiser construction time """
+    code = 'import time; start = time.time(); import jsonte; print(time.time() - start)'
+    import_times = [float(subprocess.check_output([sys.executable, '-c', code])) for i in range(args.repeat)]
+    print('import jsonte: %.1f ms (includes compiling it if there is no cached bytecode)' % (min(import_times) * 1000))
+
+    class Base(object):
+        pass
+
+    classes = [type('Type%d' % i, (Base,), {}) for i in range(20)]
+
+    def construct(type_count):
+        serialiser = jsonte.JsonteSerialiser()
+        for cls in classes[:type_count]:
+            serialiser.add_type_serialiser(cls, _dummy_serialiser)
+        serialiser.finalise_serialisers()
+
+    for type_count in (0, 5, 20):
+        print('JsonteSerialiser() with %2d extra types: %.1f us'
+              % (type_count, best_of(lambda: construct(type_count), args.number, args.repeat) * 1e6))
+
+
+@benchmark
+def bench_file(args):
+    """ random lookups of records in a file of --count records with JsonteFile, against load of the whole file """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    rows = [{u'id': i, u'name': u'user %d' % i,
+             u'created': datetime.datetime(2015, 5, 28, 22, 13, 42) + datetime.timedelta(seconds=i),
+             u'price': decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2), u'#tag': u'x' * rnd.randint(0, 100)}
+            for i in range(args.count)]
+    directory = tempfile.mkdtemp()
+    try:
+        for name, lines in ((u'rows.json', False), (u'rows.jsonl', True)):
+            path = os.path.join(directory, name)
+            with open(path, 'w') as fp:
+                if lines:
+                    serialiser.dump_lines(rows, fp)
+                else:
+                    serialiser.dump(rows, fp)
+            print('%s (%.1f MB):' % (name, os.path.getsize(path) / 1e6))
+
+            def load_all():
+                with open(path) as fp:
+                    if lines:
+                        return list(serialiser.load_lines(fp))
+                    return serialiser.load(fp)
+
+            index_path = path + '.index'
+            print('%30s: %.3fs' % ('load of the whole file', best_of(load_all, 1, args.repeat)))
+            print('%30s: %.3fs' % ('JsonteFile, building the index',
+                                   best_of(lambda: jsonte.JsonteFile(path).close(), 1, args.repeat)))
+            jsonte.JsonteFile(path, index_path=index_path).close()
+            print('%30s: %.3fs' % ('JsonteFile, with a saved index',
+                                   best_of(lambda: jsonte.JsonteFile(path, index_path=index_path).close(), 1,
+                                           args.repeat)))
+            with jsonte.JsonteFile(path, serialiser) as jsonte_file:
+                timer = timeit.default_timer
+                latencies = list()
+                for i in range(10000):
+                    index = rnd.randrange(len(jsonte_file))
+                    start = timer()
+                    jsonte_file[index]
+                    latencies.append(timer() - start)
+                latencies.sort()
+                print('%30s: median %.1f us, p99 %.1f us' % ('random lookup', percentile(latencies, 50) * 1e6,
+                                                             percentile(latencies, 99) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+@benchmark
+def bench_compile(args):
+    """ dumps of --count rows with a codec from compile, against dumps, without and with keys needing escaping """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    for note_key in (u'note', u'#note'):
+        rows = [{u'id': i, u'name': u'user %d' % i, u'score': rnd.random(), u'active': i % 2 == 0,
+                 u'price': decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2),
+                 u'day': datetime.date(2015, 1, 1) + datetime.timedelta(days=i % 365),
+                 u'created': datetime.datetime(2015, 5, 28, 22, 13, 42) + datetime.timedelta(seconds=i),
+                 u'city': u'Springfield', u'zip': u'%05d' % (i % 100000), note_key: None} for i in range(args.count)]
+        codec = serialiser.compile(sample_row=rows[0])
+        dumps_time = best_of(lambda: serialiser.dumps(rows), 1, args.repeat)
+        codec_time = best_of(lambda: codec.dumps(rows), 1, args.repeat)
+        print('%d rows, key %r: dumps %.2fs, compiled %.2fs (%.1fx)'
+              % (args.count, note_key, dumps_time, codec_time, dumps_time / codec_time))
+
+
+@benchmark
+def bench_table(args):
+    """ time and peak memory of dumps_table of --count rows of 10 columns, against dumps of a dict per row """
+    rnd = random.Random(1)
+    serialiser = jsonte.JsonteSerialiser()
+    columns = [u'id', u'name', u'score', u'active', u'price', u'cost', u'day', u'created', u'city', u'zip']
+    rows = [(i, u'user %d' % i, rnd.random(), i % 2 == 0, decimal.Decimal(rnd.randint(0, 10 ** 6)).scaleb(-2),
+             decimal.Decimal(i % 1000), datetime.date(2015, 1, 1) + datetime.timedelta(days=i % 30),
+             datetime.datetime(2015, 5, 28, 22, 13, 42) + datetime.timedelta(seconds=i), u'Springfield',
+             u'%05d' % (i % 100000)) for i in range(args.count)]
+
+    def run_dumps():
+        serialiser.dumps([dict(zip(columns, row)) for row in rows])
+
+    codec = serialiser.compile(sample_row=dict(zip(columns, rows[0])))
+    for name, func in ((u'dumps of dicts', run_dumps),
+                       (u'compiled dumps of dicts', lambda: codec.dumps([dict(zip(columns, row)) for row in rows])),
+                       (u'dumps_table', lambda: serialiser.dumps_table(columns, rows)),
+                       (u'dump_table', lambda: serialiser.dump_table(columns, rows, NullWriter()))):
+        print('%25s: %.2fs, peak %.1f MB' % (name, best_of(func, 1, args.repeat), peak_memory(func) / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for jsonte')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--number', type=int, default=100, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs (best is reported)')
+    parser.add_argument('--size', type=float, default=5, help='document size in MB, for the larger benchmarks')
+    parser.add_argument('--count', type=int, default=100000, help='number of values, for the per-value benchmarks')
+    parser.add_argument('--records', type=int, default=10000, help='rows in each corpus, for the suite')
+    parser.add_argument('--corpora', nargs='*', choices=[name for name, func in CORPORA],
+                        help='corpora for the suite (default: all)')
+    parser.add_argument('--output', help='also save the suite results to this file, as json')
+    args = parser.parse_args()
+    unknown_names = set(args.names).difference(name for name, func in BENCHMARKS)
+    if unknown_names:
+        parser.error('unknown benchmark(s): %s' % ', '.join(sorted(unknown_names)))
+    for name, func in BENCHMARKS:
+        if not args.names or name in args.names:
+            print('== %s: %s' % (name, func.__doc__.strip()))
+            func(args)
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,31 @@
 # standard libs
+import array
 import base64
+import binascii
+import codecs
+import collections
 import decimal
 import datetime
-import inspect
 import json
+import math
+import mmap
+import operator
+import os
+import pickle
+import re
+import threading
+import time
 
-# 3rd party
-import dateutil.parser
-import sdag2
-from six import string_types
+# 3rd party (dateutil is only imported when first needed, as dateutil.parser is slow to import)
+from six import PY3, integer_types, string_types
 
-__all__ = ['PreEscapedKeysMixin', 'SerialisationDict', 'JsonteSerialiser']
+try:
+    from collections.abc import MutableMapping, MutableSequence
+except ImportError:  # Python 2
+    from collections import MutableMapping, MutableSequence
+
+__all__ = ['PreEscapedKeysMixin', 'SerialisationDict', 'JsonteSerialiser', 'JsonteRecordCodec', 'JsonteLazyDict',
+           'JsonteLazyList', 'JsonteRaw', 'JsonteFile']
 
 
 class PreEscapedKeysMixin(object):
@@ -21,10 +36,36 @@ class SerialisationDict(dict, PreEscapedKeysMixin):
     pass
 
 
+class JsonteRaw(object):
+    """
+    A piece of already encoded jsonte, which dump and dumps write out as it is, without checking it or changing its
+    indentation.  loads returns these for the values at raw_paths.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        if isinstance(other, JsonteRaw):
+            return self.text == other.text
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __repr__(self):
+        return 'JsonteRaw(%r)' % self.text
+
+
 class JsonteSerialiser(object):
     def __init__(self, reserved_initial_chars=u'#', escape_char=u'~', array_websafety=None, custom_objecthook=None,
                  skipkeys=False, ensure_ascii=True, check_circular=True, allow_nan=True,
-                 indent=None, separators=None, sort_keys=False):
+                 indent=None, separators=None, sort_keys=False, binary_type='bytearray', engine='json'):
         """
         :param reserved_initial_chars: object keys starting with one of these characters will get escaped
                                        as will keys starting with the escape character
@@ -35,7 +76,20 @@ class JsonteSerialiser(object):
         :param custom_objecthook: is passed a dict, and should return either the custom object resulting, or None
                                   this is called after the conversion of any registered type deserialisers,
                                   but prior to the un-escaping of any object keys
+        :param binary_type: what #bin values are decoded to - 'bytearray', 'bytes' or 'memoryview' (a read-only view
+                            of bytes).  'bytes' and 'memoryview' avoid copying the decoded data.
+        :param engine: how dumps encodes - 'json' uses the json module's encoder, calling back for each registered type
+                       and checking the keys afterwards, while 'preconvert' first converts the registered types and
+                       escapes the keys in a single pass and then encodes the result in one go.  Both produce the
+                       same output; 'preconvert' is usually faster when there are many keys to escape.
         The rest of the paramaters are passed into json.dump(s) on each call.
+
+        The encoder used by dump and dumps is built once and reused until the options above or the registered types
+        change.  It holds no per-call state, so a single JsonteSerialiser can be shared between threads.  Types can be
+        registered while other threads are encoding and decoding: each dump(s) uses the serialisers registered when it
+        started, and added serialisers are used from when finalise_serialisers is called, while load(s) looks up the
+        deserialiser for each object as it is decoded, so one started before a deserialiser was added may use it for
+        later objects.
         """
         self.reserved_initial_chars = reserved_initial_chars
         self.escape_char = escape_char
@@ -52,58 +106,106 @@ class JsonteSerialiser(object):
         self.separators = separators
         self.sort_keys = sort_keys
         self.custom_objecthook = custom_objecthook
+        if binary_type not in _BINARY_DESERIALISERS:
+            raise ValueError("binary_type must be 'bytearray', 'bytes' or 'memoryview'")
+        self.binary_type = binary_type
+        if engine not in _ENGINES:
+            raise ValueError('engine must be one of %s' % ', '.join(repr(name) for name in sorted(_ENGINES)))
+        self.engine = engine
 
-        self._finalised = True
-        self._serialisers = list()  # list of tuples ( Class , function that converts the object to a dict )
-        self._deserialisers = list()  # list of tuples ( #name , function that returns the object )
-        self._names = set()
-        self._type_classes = set()
-        self._add_standard_types()
-        self.finalise_serialisers()
+        self._encoder_cache = None  # tuple of ( options , _JsonteRegistry , _JsonteEncoder ), see _get_encoder
+        self._stats = None  # _JsonteStats, while enabled
+        self._caches = dict()  # #name -> _LRUCache, for the names enable_cache was called for
+        self._object_hook = self._jsonte_objecthook  # wrapped while stats are enabled
+        self._decoder = json.JSONDecoder(object_hook=self._object_hook)
+        # the registered types - replaced, never changed, so encoding and decoding don't need to lock (see
+        # _JsonteRegistry), with _lock held while making the replacement so that concurrent changes aren't lost
+        deserialisers = dict(_STANDARD_DESERIALISERS)
+        deserialisers['#bin'] = _BINARY_DESERIALISERS[binary_type]
+        self._registry = _JsonteRegistry(_STANDARD_SERIALISERS, deserialisers,
+                                         serialiser_dispatch=dict(_STANDARD_SERIALISERS))
+        self._lock = threading.RLock()
+        # ( serialisers , thread ) when add_type_serialiser has been called since finalise_serialisers, with thread None
+        # in a copy unpickled from the thread that called it, where they aren't finalised for any thread
+        self._pending_serialisers = None
 
     def get_type_classes(self):
-        return self._type_classes
+        pending_serialisers = self._pending_serialisers
+        if pending_serialisers is not None:
+            return frozenset(cls for cls, func in pending_serialisers[0])
+        return self._registry.type_classes
 
     def add_type_serialiser(self, obj_cls, obj_to_jsontedict_func):
         """
         :param obj_cls: The class to serialise
         :param obj_to_jsontedict_func: A function that turns an instance of the given class into a jsonte dict
+        The serialiser is used once finalise_serialisers is called.  Until then, other threads carry on with the
+        serialisers as they were, while this thread can't use dump or dumps.
+        The serialiser for one of the standard types (eg bytes) can be replaced, but other classes can only be added
+        once.
         """
-
-        if obj_cls in self._type_classes:
-            raise ValueError('class %s already added' % obj_cls.__name__)
-        self._type_classes.add(obj_cls)
-        self._serialisers.append((obj_cls, obj_to_jsontedict_func))
-        self._finalised = False
+        with self._lock:
+            pending_serialisers = self._pending_serialisers
+            serialisers = list(self._registry.serialisers if pending_serialisers is None else pending_serialisers[0])
+            for index, (cls, func) in enumerate(serialisers):
+                if cls is obj_cls:
+                    if (cls, func) not in _STANDARD_SERIALISERS:
+                        raise ValueError('class %s already added' % obj_cls.__name__)
+                    serialisers[index] = (obj_cls, obj_to_jsontedict_func)
+                    self._pending_serialisers = (tuple(serialisers), threading.current_thread())
+                    return
+            # keep subclasses before their superclasses, so that the order that the serialisers are added does not
+            # matter, by inserting before the first superclass (any subclasses will already be before that)
+            for index, (cls, func) in enumerate(serialisers):
+                if issubclass(obj_cls, cls):
+                    serialisers.insert(index, (obj_cls, obj_to_jsontedict_func))
+                    break
+            else:
+                serialisers.append((obj_cls, obj_to_jsontedict_func))
+            self._pending_serialisers = (tuple(serialisers), threading.current_thread())
 
     def finalise_serialisers(self):
-        cls_to_vertex_name = dict()  # cls -> vertex name
-        vertex_name_to_cls = dict()  # vertex name -> cls
-        cls_to_vertex = dict()
-
-        # a directed graph is used so that the order that the serialisers are added does not matter
-        directed_graph = sdag2.DAG()
-        for obj_cls in self._type_classes:
-            vertex_name = '%s:%s' % (obj_cls.__name__, id(obj_cls))
-            cls_to_vertex_name[obj_cls] = vertex_name
-            vertex_name_to_cls[vertex_name] = obj_cls
-            vertex = directed_graph.add(vertex_name)
-            cls_to_vertex[obj_cls] = vertex
-
-        for obj_cls in self._type_classes:
-            superclasses = set(inspect.getmro(obj_cls)).intersection(self._type_classes)
-            for supercls in superclasses:
-                if supercls is not obj_cls:
-                    directed_graph.add_edge(cls_to_vertex[obj_cls], cls_to_vertex[supercls])
-
-        cls_to_func_map = dict(self._serialisers)
-        new_serialisers_list = list()
-        for vertex_name in directed_graph.topologicaly():
-            obj_cls = vertex_name_to_cls[vertex_name]
-            func = cls_to_func_map[obj_cls]
-            new_serialisers_list.append((obj_cls, func))
-        self._serialisers = new_serialisers_list
-        self._finalised = True
+        """ Start using the serialisers added since this was last called, in all threads """
+        with self._lock:
+            pending_serialisers = self._pending_serialisers
+            if pending_serialisers is not None:
+                self._registry = self._registry.replace(serialisers=pending_serialisers[0])
+                self._pending_serialisers = None
+
+    def _resolve_type_serialiser(self, obj_cls, obj=None, registry=None):
+        """
+        Find the serialiser function for instances of obj_cls, or None if there is not one, and memoise the result
+        (in registry, by default the current one) so that later lookups for the same concrete class are a single
+        dict hit.
+        Otherwise unhandled classes supporting the buffer protocol (checked using obj, an instance of obj_cls) use
+        the serialiser registered for bytearray.
+        """
+        if registry is None:
+            registry = self._registry
+        if issubclass(obj_cls, _WRAPPER_TYPES):
+            # written out by the encoders themselves, even if a serialiser is registered for eg object
+            registry.serialiser_dispatch[obj_cls] = None
+            return None
+        cls_to_func_map = dict(registry.serialisers)
+        for cls in _getmro(obj_cls):
+            if cls in cls_to_func_map:
+                func = cls_to_func_map[cls]
+                break
+        else:
+            # fall back to issubclass for classes that are only registered with an abstract base class
+            for cls, func in registry.serialisers:
+                if issubclass(obj_cls, cls):
+                    break
+            else:
+                cls = func = None
+        if func is None and obj is not None and bytearray in cls_to_func_map and _supports_buffer(obj):
+            cls = bytearray
+            func = cls_to_func_map[bytearray]
+        if func is not None and self._stats is not None:
+            func = self._stats.wrap('serialisers', _class_name(cls), func)
+        if func is not None or obj is not None:  # without obj, the buffer protocol couldn't be checked
+            registry.serialiser_dispatch[obj_cls] = func
+        return func
 
     def add_type_deserialiser(self, name, dict_to_obj_func):
         if not name:
@@ -112,77 +214,1113 @@ class JsonteSerialiser(object):
             raise ValueError('name must start with a reserved char')
         if len(name) >= 2 and name[1] == self.escape_char:
             raise ValueError('the 2nd char of the name must not be the escape char')
-        if name in self._names:
-            raise ValueError('name %s already added' % name)
-        self._names.add(name)
-        self._deserialisers.append((name, dict_to_obj_func))
+        with self._lock:
+            if name in self._registry.names:
+                raise ValueError('name %s already added' % name)
+            deserialisers = dict(self._registry.deserialisers)
+            deserialisers[name] = dict_to_obj_func
+            self._update_deserialiser_dispatch(deserialisers)
 
     def _jsonte_objecthook(self, dct):
         assert isinstance(dct, dict)
-        for keyname, dict_to_obj_func in self._deserialisers:
-            if keyname in dct:
-                return dict_to_obj_func(dct)
+        registry = self._registry
+        # plain objects are the common case, so only look at the keys one by one if a type name is present
+        if not registry.names.isdisjoint(dct):
+            for key in dct:
+                dict_to_obj_func = registry.deserialiser_dispatch.get(key)
+                if dict_to_obj_func is not None:
+                    return dict_to_obj_func(dct)
         if self.custom_objecthook:
             obj = self.custom_objecthook(dct)
             if obj is not None:
                 return obj
-        if self.escape_char:
+        escape_char = self.escape_char
+        if escape_char and escape_char in u''.join(dct):  # cheap check for the escape char anywhere in the keys
             for key in list(dct.keys()):   # don't iterate - must use a list since we are modifying the keys in place
-                if key[0] == self.escape_char:
+                if key[:1] == escape_char:
                     dct[key[1:]] = dct.pop(key)
         return dct
     
-    def _add_standard_types(self):
-        self.add_type_serialiser(decimal.Decimal, decimal_serialiser)
-        self.add_type_deserialiser('#num', decimal_deserialiser)
+    def _get_encoder(self):
+        """
+        Return the cached encoder, first building a new one if the encoding options or the registered types have
+        changed since it was built.
+        """
+        pending_serialisers = self._pending_serialisers
+        if pending_serialisers is not None and pending_serialisers[1] in (None, threading.current_thread()):
+            raise RuntimeError('use of dump or dumps when not JsonteSerialiser not finalised')
+        options = (self.reserved_initial_chars, self.escape_char, self.skipkeys, self.ensure_ascii,
+                   self.check_circular, self.allow_nan, self.indent, self.separators, self.sort_keys, self.engine)
+        encoder_cache = self._encoder_cache
+        if encoder_cache is None or encoder_cache[0] != options or encoder_cache[1] is not self._registry:
+            encoder = _ENGINES[self.engine](self, skipkeys=self.skipkeys, ensure_ascii=self.ensure_ascii,
+                                            check_circular=self.check_circular, allow_nan=self.allow_nan,
+                                            indent=self.indent, separators=self.separators, sort_keys=self.sort_keys)
+            encoder_cache = (options, encoder.registry, encoder)
+            self._encoder_cache = encoder_cache  # a single assignment, so other threads see old or new, never a mix
+        return encoder_cache[2]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # caches, which are rebuilt as needed (the decoder and lock can't be pickled)
+        del state['_decoder']
+        del state['_object_hook']
+        del state['_lock']
+        state['_encoder_cache'] = None
+        state['_registry'] = self._registry.replace(deserialiser_dispatch=self._registry.deserialisers)
+        pending_serialisers = self._pending_serialisers
+        if pending_serialisers is not None:
+            if pending_serialisers[1] is threading.current_thread():
+                # not finalised by this thread, so not by any thread of the copy either
+                state['_pending_serialisers'] = (pending_serialisers[0], None)
+            else:  # other threads don't see them until they are finalised
+                state['_pending_serialisers'] = None
+        # stats are not carried over, and caches start empty
+        state['_stats'] = None
+        state['_caches'] = dict((name, _LRUCache(cache.maxsize)) for name, cache in self._caches.items())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._object_hook = self._jsonte_objecthook
+        self._decoder = json.JSONDecoder(object_hook=self._object_hook)
+        self._update_deserialiser_dispatch()
 
-        self.add_type_serialiser(datetime.datetime, timestamp_serialiser)
-        self.add_type_deserialiser('#tstamp', timestamp_deserialiser)
+    def enable_stats(self, sample_every=1):
+        """
+        Start (or restart) collecting the stats returned by stats.  While disabled there is no overhead at all.
+        :param sample_every: only time one in every sample_every calls of each serialiser and deserialiser (which is
+                             most of the overhead), to keep the overhead low enough to leave on.  The times reported
+                             are then estimates, though the counts are still exact.
+        """
+        if sample_every < 1:
+            raise ValueError('sample_every must be at least 1')
+        stats = _JsonteStats(sample_every)
+        self._stats = stats
+        self._update_deserialiser_dispatch()
+        self._set_object_hook(stats.wrap_objecthook(self._jsonte_objecthook, self.escape_char))
 
-        self.add_type_serialiser(datetime.date, date_serialiser)
-        self.add_type_deserialiser('#date', date_deserialiser)
+    def disable_stats(self):
+        """ Stop collecting stats, removing all the overhead """
+        self._stats = None
+        self._update_deserialiser_dispatch()
+        self._set_object_hook(self._jsonte_objecthook)
 
-        self.add_type_serialiser(datetime.time, time_serialiser)
-        self.add_type_deserialiser('#time', time_deserialiser)
+    def stats(self):
+        """
+        Return the stats collected since enable_stats (or reset_stats), as a dict of:
+          serialisers: {registered class name: {'calls': count, 'time': total seconds}}
+          deserialisers: {type name, eg '#num': {'calls': count, 'time': total seconds}}
+          objects: the number of objects decoded (ie passed to the object hook)
+          unescaped_keys: the number of keys un-escaped when decoding
+          escaped_keys: the number of keys escaped when encoding
+        """
+        if self._stats is None:
+            raise RuntimeError('stats are not enabled')
+        return self._stats.report()
 
-        self.add_type_serialiser(bytearray, binary_serialiser)
-        self.add_type_deserialiser('#bin', binary_deserialiser)
+    def reset_stats(self):
+        if self._stats is None:
+            raise RuntimeError('stats are not enabled')
+        self._stats.reset()
 
-    def dump(self, obj, fp):
+    def enable_cache(self, names=('#num', '#tstamp', '#date', '#time'), maxsize=4096):
+        """
+        Cache the results of the deserialisers for the given type names, so that each distinct value is only
+        converted once while it stays in the cache, and the same object is returned each time it occurs.
+        Only use this for deserialisers that return immutable objects (as the standard ones for these names do).
+        Calling this again for a name replaces its cache with an empty one.
+        :param maxsize: the number of values kept for each name, with the least recently used dropped first
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        unknown_names = set(names).difference(self._registry.names)
+        if unknown_names:
+            raise ValueError('no deserialiser for %s' % ', '.join(sorted(unknown_names)))
+        for name in names:
+            self._caches[name] = _LRUCache(maxsize)
+        self._update_deserialiser_dispatch()
+
+    def disable_cache(self, names=None):
+        """ Stop caching for the given type names, by default all of them """
+        for name in list(self._caches) if names is None else names:
+            self._caches.pop(name, None)
+        self._update_deserialiser_dispatch()
+
+    def cache_info(self):
+        """
+        Return {type name: {'hits', 'misses', 'evictions', 'size', 'maxsize', 'hit_rate'}} for each cached name,
+        counted since enable_cache
+        """
+        return dict((name, cache.info()) for name, cache in self._caches.items())
+
+    def _update_deserialiser_dispatch(self, deserialisers=None):
+        """
+        Replace the registry, with the given deserialisers (by default the current ones), and the functions called
+        for each type name, which wrap the deserialisers for any caches and stats
+        """
+        with self._lock:
+            if deserialisers is None:
+                deserialisers = self._registry.deserialisers
+            deserialiser_dispatch = deserialisers
+            if self._caches or self._stats is not None:
+                deserialiser_dispatch = dict()
+                for name, func in deserialisers.items():
+                    if name in self._caches:
+                        func = self._caches[name].wrap(name, func)
+                    if self._stats is not None:
+                        func = self._stats.wrap('deserialisers', name, func)
+                    deserialiser_dispatch[name] = func
+            self._registry = self._registry.replace(deserialisers=deserialisers,
+                                                    deserialiser_dispatch=deserialiser_dispatch)
+
+    def _set_object_hook(self, object_hook):
+        self._object_hook = object_hook
+        self._decoder = json.JSONDecoder(object_hook=object_hook)
+        # the serialisers are wrapped (or not) as they are next used, by a new encoder
+        with self._lock:
+            self._registry = self._registry.replace()
+
+    def _get_decoder(self, parse_float=None, parse_int=None, parse_constant=None):
+        """ Return the shared decoder, or a new one if any of the parse functions are given """
+        if parse_float is None and parse_int is None and parse_constant is None:
+            return self._decoder
+        return json.JSONDecoder(object_hook=self._object_hook, parse_float=parse_float,
+                                parse_int=parse_int, parse_constant=parse_constant)
+
+    def _websafety_prefix_for(self, obj):
+        """ Return the prefix to write before obj (if any), or raise if obj can't be written with array_websafety """
         if self.array_websafety and isinstance(obj, list):
             if self.array_websafety == 'exception':
                 raise RuntimeError('passed a list with array_websafety set to exception')
             elif self.array_websafety == 'prefix':
-                fp.write(self.websafety_prefix)
+                return self.websafety_prefix
             else:
                 raise RuntimeError('invalid array_websafety value')
-        iterable = _JsonteEncoder(self, skipkeys=self.skipkeys, ensure_ascii=self.ensure_ascii,
-                                  check_circular=self.check_circular, allow_nan=self.allow_nan, indent=self.indent,
-                                  separators=self.separators, sort_keys=self.sort_keys).iterencode(obj)
+        return u''
+
+    def dump(self, obj, fp):
+        prefix = self._websafety_prefix_for(obj)
+        if prefix:
+            fp.write(prefix)
+        iterable = self._get_encoder().iterencode(obj)
         for chunk in iterable:
             fp.write(chunk)
 
     def dumps(self, obj):
-        raw_json_str = _JsonteEncoder(self, skipkeys=self.skipkeys, ensure_ascii=self.ensure_ascii,
-                                      check_circular=self.check_circular, allow_nan=self.allow_nan, indent=self.indent,
-                                      separators=self.separators, sort_keys=self.sort_keys).encode(obj)
-        if self.array_websafety and isinstance(obj, list):
-            if self.array_websafety == 'exception':
+        raw_json_str = self._get_encoder().encode(obj)
+        prefix = self._websafety_prefix_for(obj)
+        return prefix + raw_json_str if prefix else raw_json_str
+
+    def load(self, fp, encoding=None, cls=None, parse_float=None, parse_int=None, parse_constant=None, lazy=False,
+             raw_paths=None, **kw):
+        """ As json.load.  See loads for lazy and raw_paths. """
+        return self.loads(fp.read(), encoding=encoding, cls=cls, parse_float=parse_float, parse_int=parse_int,
+                          parse_constant=parse_constant, lazy=lazy, raw_paths=raw_paths, **kw)
+
+    def loads(self, s, encoding=None, cls=None, parse_float=None, parse_int=None, parse_constant=None, lazy=False,
+              raw_paths=None, **kw):
+        """
+        As json.loads.
+        :param lazy: if true, return objects as JsonteLazyDicts and arrays as JsonteLazyLists, which only convert
+                     tagged values when they are accessed, so values that are never looked at are never converted
+                     (and any errors in converting them are not raised until they are)
+        :param raw_paths: sequence of key paths (each a sequence of un-escaped object keys, as for iterload) to values
+                          that are not to be decoded, but returned as JsonteRaw, holding their jsonte text.  Any that
+                          are left as they are will be written out again by dump and dumps without being re-encoded.
+                          Can't be used with cls or the other json.loads keyword arguments.
+        """
+        if encoding is not None:  # json no longer accepts encoding at all from Python 3.9
+            kw['encoding'] = encoding
+        if raw_paths:
+            if cls is not None or kw:
+                raise ValueError('raw_paths can not be used with cls or other json.loads arguments')
+            return self._loads_with_raw_paths(s, parse_float, parse_int, parse_constant, lazy, raw_paths)
+        if lazy:
+            lazy_objecthook, escape = self._make_lazy_objecthook()
+            obj = json.loads(s, cls=cls, object_hook=lazy_objecthook,
+                             parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, **kw)
+            return _lazy_value(obj, escape)
+        return json.loads(s, cls=cls, object_hook=self._object_hook,
+                          parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, **kw)
+
+    def _loads_with_raw_paths(self, s, parse_float, parse_int, parse_constant, lazy, raw_paths):
+        paths = [tuple(path) for path in raw_paths]
+        if not all(paths):
+            raise ValueError('raw_paths must not include an empty path')
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+        if lazy:
+            objecthook, escape = self._make_lazy_objecthook()
+            decoder = json.JSONDecoder(object_hook=objecthook, parse_float=parse_float, parse_int=parse_int,
+                                       parse_constant=parse_constant)
+        else:
+            objecthook, escape = self._object_hook, None
+            decoder = self._get_decoder(parse_float, parse_int, parse_constant)
+        obj, end = _decode_with_raw_paths(s, _WHITESPACE_RE.match(s).end(), decoder, objecthook, paths,
+                                          self.escape_char)
+        end = _WHITESPACE_RE.match(s, end).end()
+        if end != len(s):
+            raise ValueError('extra data at char %d' % end)
+        return _lazy_value(obj, escape) if lazy else obj
+
+    def _make_lazy_objecthook(self):
+        """ Return the object hook for loads(lazy=True), and the function escaping keys for JsonteLazyDict.raw """
+        registry = self._registry
+        names = registry.names
+        deserialiser_dispatch = registry.deserialiser_dispatch
+        objecthook = self._object_hook
+        escape = _make_key_escaper(self.escape_char, self.reserved_initial_chars) if self.escape_char else None
+
+        def lazy_objecthook(dct):
+            if not names.isdisjoint(dct):
+                for key in dct:
+                    dict_to_obj_func = deserialiser_dispatch.get(key)
+                    if dict_to_obj_func is not None:
+                        return _LazyTagged(dict_to_obj_func, dct)
+            obj = objecthook(dct)  # un-escapes the keys, and calls any custom_objecthook
+            return JsonteLazyDict(obj, escape) if type(obj) is dict else obj
+        return lazy_objecthook, escape
+
+    def iterload(self, fp, path=None, chunk_size=65536, parse_float=None, parse_int=None, parse_constant=None):
+        """
+        Decode the items of a json array in fp one at a time, reading fp in chunks, so that only around one item
+        needs to be held in memory however large the array is.
+        :param fp: file like object (text or utf-8 binary) containing the document
+        :param path: sequence of (un-escaped) object keys leading to the array, by default the top-level array
+        :param chunk_size: size of each read from fp
+        """
+        decoder = self._get_decoder(parse_float, parse_int, parse_constant)
+        parser = _ArrayItemParser(decoder, path, self.escape_char, self.websafety_prefix)
+        text_decoder = None
+        while not parser.done:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, bytes):
+                if text_decoder is None:
+                    text_decoder = codecs.getincrementaldecoder('utf-8')()
+                chunk = text_decoder.decode(chunk)
+            for item in parser.feed(chunk):
+                yield item
+        for item in parser.close():
+            yield item
+
+    def dump_async(self, obj, writer, chunk_size=65536):
+        """
+        Coroutine writing obj to an asyncio.StreamWriter as utf-8, draining the writer and handing control back to the
+        event loop after each chunk of around chunk_size characters.  Requires Python 3.6+, see jsonte_async.
+        """
+        import jsonte_async
+        return jsonte_async.dump_async(self, obj, writer, chunk_size)
+
+    def load_async(self, reader, chunk_size=65536, parse_float=None, parse_int=None, parse_constant=None):
+        """
+        Coroutine reading a whole document from an asyncio.StreamReader and decoding it.
+        Requires Python 3.6+, see jsonte_async.
+        """
+        import jsonte_async
+        return jsonte_async.load_async(self, reader, chunk_size, parse_float, parse_int, parse_constant)
+
+    def iterload_async(self, reader, path=None, chunk_size=65536, parse_float=None, parse_int=None,
+                       parse_constant=None):
+        """
+        Asynchronous iterator over the items of a json array read from an asyncio.StreamReader, as for iterload.
+        Requires Python 3.6+, see jsonte_async.
+        """
+        import jsonte_async
+        return jsonte_async.iterload_async(self, reader, path, chunk_size, parse_float, parse_int, parse_constant)
+
+    def dump_lines(self, iterable, fp, buffer_size=65536):
+        """
+        Write each object in iterable to fp as a single line (ie JSON Lines), in writes of around buffer_size.
+        With array_websafety set to 'prefix', the prefix is written once, as the first line.
+        """
+        encoder = self._get_encoder()
+        if self.indent is not None or u'\n' in encoder.item_separator + encoder.key_separator:
+            raise ValueError('dump_lines can not be used with an indent or separators containing newlines')
+        encode = encoder.encode
+        if self.array_websafety == 'prefix':
+            fp.write(self.websafety_prefix)
+        lines = list()
+        size = 0
+        for obj in iterable:
+            if self.array_websafety == 'exception' and isinstance(obj, list):
                 raise RuntimeError('passed a list with array_websafety set to exception')
-            elif self.array_websafety == 'prefix':
-                return self.websafety_prefix + raw_json_str
+            line = encode(obj)
+            lines.append(line)
+            size += len(line)
+            if size >= buffer_size:
+                lines.append(u'')
+                fp.write(u'\n'.join(lines))
+                lines = list()
+                size = 0
+        if lines:
+            lines.append(u'')
+            fp.write(u'\n'.join(lines))
+
+    def load_lines(self, fp, parse_float=None, parse_int=None, parse_constant=None):
+        """
+        Decode each line of fp (text or utf-8 binary) as a separate object, yielding them one at a time.
+        Blank lines, and a websafety prefix on the first line, are skipped.
+        """
+        decode = self._get_decoder(parse_float, parse_int, parse_constant).decode
+        websafety_prefix = self.websafety_prefix.rstrip()
+        first = True
+        for line in fp:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.strip()
+            if first:
+                first = False
+                if line == websafety_prefix:
+                    continue
+            if line:
+                yield decode(line)
+
+    def compile(self, schema=None, sample_row=None):
+        """
+        Return a JsonteRecordCodec, for encoding and decoding lists of rows (dicts) that have the same keys, in the
+        same order, with values of the same types.  Its output is the same as that of dumps and loads.
+        It uses the options and registered types as they are now, so compile again after changing them.
+        :param schema: sequence of (key, type) pairs (or a dict of key -> type) in the order of the keys in the rows.
+                       A type of None means any type (as does list, dict or object), for values that are encoded
+                       and decoded as normal.
+        :param sample_row: a row to take the schema from, instead of giving the schema
+        """
+        return JsonteRecordCodec(self, schema, sample_row)
+
+    def dumps_table(self, columns, rows, batch_size=10000):
+        """
+        dumps a table as a list of objects, giving the same as dumps([dict(zip(columns, row)) for row in rows]), but
+        converting the values a column at a time (so the type of each value isn't looked up separately), without
+        making a dict for each row or each value of a registered type.
+        :param columns: the keys, in order
+        :param rows: iterable of rows, each a sequence of values in the order of columns
+        :param batch_size: the number of rows converted at a time
+        """
+        if self.array_websafety == 'exception':
+            raise RuntimeError('passed a list with array_websafety set to exception')
+        chunks = list(self._iter_table_chunks(columns, rows, batch_size))
+        if self.array_websafety == 'prefix':
+            chunks.insert(0, self.websafety_prefix)
+        return u''.join(chunks)
+
+    def dump_table(self, columns, rows, fp, batch_size=10000):
+        """ As dumps_table, but writing to fp a batch of rows at a time """
+        if self.array_websafety == 'exception':
+            raise RuntimeError('passed a list with array_websafety set to exception')
+        elif self.array_websafety == 'prefix':
+            fp.write(self.websafety_prefix)
+        for chunk in self._iter_table_chunks(columns, rows, batch_size):
+            fp.write(chunk)
+
+    def _iter_table_chunks(self, columns, rows, batch_size):
+        encoder = self._get_encoder()
+        if self.indent is not None:
+            raise ValueError('dumps_table can not be used with an indent')
+        columns = list(columns)
+        if len(set(columns)) != len(columns) or not all(isinstance(column, string_types) for column in columns):
+            raise ValueError('the columns must be unique strings')
+        order = sorted(range(len(columns)), key=_escaped_keys(encoder, columns).__getitem__) if self.sort_keys \
+            else list(range(len(columns)))
+        template = _row_template(encoder, [_escaped_keys(encoder, columns)[i] for i in order])
+        converters = dict()  # value type -> function, or None if left to the encoder
+        item_separator = encoder.item_separator
+        rows = iter(rows)
+        separator = u''
+        yield u'['
+        while True:
+            batch = [row for i, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            if set(map(len, batch)) == set([len(columns)]) and columns:
+                values_by_column = list(zip(*batch))
+                texts = map(template.__mod__, zip(*[_convert_column(self, encoder, converters, values_by_column[i])
+                                                    for i in order]))
+            else:  # rows of the wrong length (which zip would truncate) or no columns
+                texts = [encoder.encode(dict(zip(columns, row))) for row in batch]
+            yield separator + item_separator.join(texts)
+            separator = item_separator
+        yield u']'
+
+    def dumps_many(self, objs, workers=None, chunksize=256):
+        """
+        dumps each of objs, spread over a pool of worker processes, returning a list of the results in order.
+        The serialiser is pickled to the workers, so all registered classes and functions (and any custom_objecthook)
+        must be importable, ie defined at the top level of a module.
+        :param workers: number of processes, by default the number of CPUs (if 1, everything is done in this process)
+        :param chunksize: number of objects sent to a worker at a time
+        """
+        return self._map_in_workers(_worker_dumps, self.dumps, objs, workers, chunksize)
+
+    def loads_many(self, strings, workers=None, chunksize=256):
+        """ loads each of strings, spread over a pool of worker processes, as for dumps_many """
+        return self._map_in_workers(_worker_loads, self.loads, strings, workers, chunksize)
+
+    def _map_in_workers(self, worker_func, func, items, workers, chunksize):
+        if workers is None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            return [func(item) for item in items]
+        try:
+            serialiser_state = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError('the serialiser can not be sent to worker processes - registered classes and functions '
+                             'must be importable (%s)' % e)
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                    initargs=(serialiser_state,)) as executor:
+            return list(executor.map(worker_func, items, chunksize=chunksize))
+
+
+class _JsonteRegistry(object):
+    """
+    The types registered with a JsonteSerialiser.  It is replaced with an updated copy on each change rather than
+    being changed (apart from serialiser_dispatch, which is only added to, with results that depend only on the rest),
+    so each encoding, or object decoded, can use one without locking, seeing the types either before or after any
+    change made at the same time in another thread, and never partly updated.
+    """
+    def __init__(self, serialisers, deserialisers, deserialiser_dispatch=None, serialiser_dispatch=None):
+        # tuple of tuples ( Class , function that converts the object to a dict ), subclasses before superclasses
+        self.serialisers = tuple(serialisers)
+        self.type_classes = frozenset(cls for cls, func in self.serialisers)
+        # concrete class -> function (or None), filled in on first use
+        self.serialiser_dispatch = dict() if serialiser_dispatch is None else serialiser_dispatch
+        self.deserialisers = deserialisers  # #name -> function that returns the object
+        self.names = frozenset(deserialisers)
+        # the functions called for each #name, which wrap the deserialisers for stats and caches
+        self.deserialiser_dispatch = deserialisers if deserialiser_dispatch is None else deserialiser_dispatch
+
+    def replace(self, serialisers=None, deserialisers=None, deserialiser_dispatch=None):
+        """ Return a copy with the given parts replaced, and nothing memoised in serialiser_dispatch """
+        if deserialisers is not None and deserialiser_dispatch is None:
+            deserialiser_dispatch = deserialisers
+        return _JsonteRegistry(self.serialisers if serialisers is None else serialisers,
+                               self.deserialisers if deserialisers is None else deserialisers,
+                               self.deserialiser_dispatch if deserialiser_dispatch is None else deserialiser_dispatch)
+
+
+class JsonteRecordCodec(object):
+    """
+    dumps and loads for lists of rows with a known schema, as returned by JsonteSerialiser.compile.
+    Each row is encoded by filling in a template of the already escaped keys, after checking (in bulk) that the keys
+    and the types of the values are as expected, so no key needs checking for escaping and no value's type needs
+    looking up.  A row that doesn't match the schema, or a value that doesn't match its type, is encoded as normal.
+    """
+    def __init__(self, jsonte_serialiser, schema=None, sample_row=None):
+        if (schema is None) == (sample_row is None):
+            raise ValueError('either schema or sample_row must be given')
+        if sample_row is not None:
+            schema = [(key, type(value)) for key, value in sample_row.items()]
+        elif isinstance(schema, dict):
+            schema = list(schema.items())
+        serialiser = jsonte_serialiser
+        if serialiser.indent is not None:
+            raise ValueError('compile can not be used with an indent')
+        encoder = serialiser._get_encoder()
+        self.jsonte_serialiser = serialiser
+        self.keys = tuple(key for key, column_type in schema)
+        if len(set(self.keys)) != len(self.keys) or not all(isinstance(key, string_types) for key in self.keys):
+            raise ValueError('the keys in the schema must be unique strings')
+        self._encode = encoder.encode
+        self._item_separator = encoder.item_separator
+
+        # the template has a %s for each value, in the order of the columns
+        columns = list(zip(_escaped_keys(encoder, self.keys), self.keys, (column_type for key, column_type in schema)))
+        if serialiser.sort_keys:
+            columns.sort()
+        self._check_order = not serialiser.sort_keys
+        self._template = _row_template(encoder, [escaped_key for escaped_key, key, column_type in columns])
+        self._getter = _tuple_getter([key for escaped_key, key, column_type in columns])
+        self._converters = list()
+        self._types = list()  # None for any type
+        for escaped_key, key, column_type in columns:
+            converter = _make_value_converter(serialiser, encoder, column_type)
+            if converter is None:
+                # types from a sample row that are only handled by the encoder (eg buffer protocol objects or
+                # JsonteRaw) are left to it, like any type
+                if column_type not in _ANY_TYPES and sample_row is None:
+                    raise ValueError('no serialiser for the type of %r: %s' % (key, column_type.__name__))
+                converter, column_type = self._encode, None
+            self._converters.append(converter)
+            self._types.append(column_type)
+        checked = [i for i, column_type in enumerate(self._types) if column_type is not None]
+        self._checked_values = _tuple_getter(checked)
+        self._checked_types = tuple(self._types[i] for i in checked)
+        self._float_values = _tuple_getter([i for i, column_type in enumerate(self._types) if column_type is float])
+
+    def encode_row(self, row):
+        """ Return the jsonte for a single row, the same as dumps(row) """
+        if type(row) is not dict or len(row) != len(self.keys) or (self._check_order and tuple(row) != self.keys):
+            return self._encode(row)
+        try:
+            values = self._getter(row)
+        except KeyError:  # other keys, which aren't checked above with sort_keys
+            return self._encode(row)
+        if tuple(map(type, self._checked_values(values))) == self._checked_types and \
+                all(map(_isfinite, self._float_values(values))):
+            return self._template % tuple(map(_call, self._converters, values))
+        # some values don't match the schema, so encode those as normal
+        return self._template % tuple(converter(value) if type(value) is column_type and column_type is not float
+                                      else self._encode(value)
+                                      for converter, column_type, value in zip(self._converters, self._types, values))
+
+    def dumps(self, rows):
+        """ The same as JsonteSerialiser.dumps(rows), for a list of rows (or any iterable, also written as an array) """
+        serialiser = self.jsonte_serialiser
+        prefix = u''
+        if serialiser.array_websafety:
+            if serialiser.array_websafety == 'exception':
+                raise RuntimeError('passed a list with array_websafety set to exception')
+            elif serialiser.array_websafety == 'prefix':
+                prefix = serialiser.websafety_prefix
             else:
                 raise RuntimeError('invalid array_websafety value')
-        else:
-            return raw_json_str
+        return prefix + u'[' + self._item_separator.join(map(self.encode_row, rows)) + u']'
 
-    def load(self, fp, encoding=None, cls=None, parse_float=None, parse_int=None, parse_constant=None, **kw):
-        return json.load(fp, encoding=encoding, cls=cls, object_hook=self._jsonte_objecthook,
-                         parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, **kw)
+    def loads(self, s):
+        """
+        The same as JsonteSerialiser.loads(s).  (Decoding has no schema specific quick path, as the object hook
+        already passes over rows of plain values quickly and most of the time goes on the deserialisers.)
+        """
+        return self.jsonte_serialiser.loads(s)
 
-    def loads(self, s, encoding=None, cls=None, parse_float=None, parse_int=None, parse_constant=None, **kw):
-        return json.loads(s, encoding=encoding, cls=cls, object_hook=self._jsonte_objecthook,
-                          parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, **kw)
+
+_ANY_TYPES = (None, object, dict, list, tuple)  # schema types for values that are left to the encoder
+_call = getattr(operator, 'call', lambda func, arg: func(arg))
+_intstr = int.__repr__ if PY3 else str
+_isfinite = getattr(math, 'isfinite', lambda x: not (math.isinf(x) or math.isnan(x)))
+
+
+class JsonteFile(object):
+    """
+    Random access to the records of a large jsonte file - either the items of a top-level array, or the lines of a
+    JSON Lines file.  The file is memory mapped, and indexed in a single scan when opened, recording where each record
+    starts and ends, so that records are only read and decoded when asked for.  Supports len, indexing (including
+    negative indexes and slices, which return lists) and iteration.  Use close (or a with statement) when done.
+    """
+    def __init__(self, path, jsonte_serialiser=None, lines=None, index_path=None, chunk_size=1 << 20):
+        """
+        :param jsonte_serialiser: the JsonteSerialiser used to decode the records (a default one if not given)
+        :param lines: True for JSON Lines and False for an array, by default determined from the file extension
+                      (.jsonl or .ndjson for JSON Lines) or else whether the file starts with an array
+        :param index_path: file to save the index to, so that opening the file again doesn't need to scan it.
+                           It is rebuilt if it doesn't match the file's size and modification time.
+        :param chunk_size: size of the pieces of an array that are scanned at a time
+        """
+        self.jsonte_serialiser = jsonte_serialiser or JsonteSerialiser()
+        self.path = path
+        self._fp = open(path, 'rb')
+        try:
+            stat = os.fstat(self._fp.fileno())
+            self._data = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+            if lines is None:
+                lines = os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') or not self._starts_with_array()
+            self.lines = lines
+            file_id = [stat.st_size, stat.st_mtime, 'lines' if lines else 'array']
+            self._starts = self._ends = None
+            if index_path is not None:
+                self._load_index(index_path, file_id)
+            if self._starts is None:
+                if lines:
+                    self._starts, self._ends = _index_json_lines(self._data, self.jsonte_serialiser.websafety_prefix)
+                else:
+                    self._starts, self._ends = _index_json_array(self._data, self._array_start(), chunk_size)
+                if index_path is not None:
+                    self._save_index(index_path, file_id)
+        except BaseException:
+            self.close()
+            raise
+
+    def _array_start(self):
+        """ Return the offset of the top-level array's [, after any websafety prefix """
+        prefix = self.jsonte_serialiser.websafety_prefix.encode('utf-8')
+        start = len(prefix) if self._data[:len(prefix)] == prefix else 0
+        match = _BYTES_WHITESPACE_RE.match(self._data, start)
+        return match.end()
+
+    def _starts_with_array(self):
+        start = self._array_start()
+        return self._data[start:start + 1] == b'['
+
+    def _load_index(self, index_path, file_id):
+        try:
+            with open(index_path, 'rb') as fp:
+                header = json.loads(fp.readline().decode('utf-8'))
+                if header['file'] != file_id or header['typecode'] != _OFFSET_TYPECODE:
+                    return
+                starts = array.array(_OFFSET_TYPECODE)
+                ends = array.array(_OFFSET_TYPECODE)
+                starts.fromfile(fp, header['count'])
+                ends.fromfile(fp, header['count'])
+        except (IOError, OSError, ValueError, KeyError, EOFError):
+            return  # missing, out of date or damaged, so rebuilt
+        self._starts, self._ends = starts, ends
+
+    def _save_index(self, index_path, file_id):
+        header = {'file': file_id, 'typecode': _OFFSET_TYPECODE, 'count': len(self._starts)}
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'wb') as fp:
+            fp.write(json.dumps(header).encode('utf-8') + b'\n')
+            self._starts.tofile(fp)
+            self._ends.tofile(fp)
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, index_path)
+        else:  # Python 2
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            os.rename(temp_path, index_path)
+
+    def raw(self, index):
+        """ Return the jsonte text of the record at index, without decoding it """
+        return self._data[self._starts[index]:self._ends[index]].decode('utf-8')
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._starts)))]
+        return self.jsonte_serialiser._get_decoder().decode(self.raw(index))
+
+    def __iter__(self):
+        for index in range(len(self._starts)):
+            yield self[index]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b''
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _string_encoder(encoder):
+    return json.encoder.encode_basestring_ascii if encoder.ensure_ascii else json.encoder.encode_basestring
+
+
+def _escaped_keys(encoder, keys):
+    escape_char = encoder.escape_char
+    chars_to_escape = encoder.chars_to_escape
+    return tuple(escape_char + key if escape_char and key[:1] and key[0] in chars_to_escape else key for key in keys)
+
+
+def _row_template(encoder, escaped_keys):
+    """ Return the text of an object with the given keys, with a %s for each value """
+    _encoder = _string_encoder(encoder)
+    return u'{%s}' % encoder.item_separator.replace(u'%', u'%%').join(
+        (_encoder(key) + encoder.key_separator).replace(u'%', u'%%') + u'%s' for key in escaped_keys)
+
+
+def _make_value_converter(serialiser, encoder, value_type):
+    """
+    Return a function converting values of exactly value_type to jsonte, the same as encoder would, or None for types
+    that are left to the encoder.  The function for floats doesn't handle nan or infinity, so check for them first.
+    """
+    _encoder = _string_encoder(encoder)
+    if value_type in _ANY_TYPES:
+        return None
+    elif value_type in string_types:
+        return _encoder
+    elif value_type in integer_types and value_type is not bool:
+        return _intstr
+    elif value_type is float:
+        return float.__repr__
+    elif value_type is bool:
+        return {True: u'true', False: u'false'}.__getitem__
+    elif value_type is type(None):
+        return {None: u'null'}.__getitem__
+    func = serialiser._resolve_type_serialiser(value_type, registry=encoder.registry)
+    if func is None:
+        return None
+    text_template = _standard_text_template(func, encoder)
+    if text_template is not None:
+        template, text_func = text_template
+        return lambda value: template % text_func(value)
+    fragments = dict()  # type name -> text up to the value
+    encode = encoder.encode
+
+    def converter(value):
+        dct = func(value)
+        if len(dct) == 1 and isinstance(dct, PreEscapedKeysMixin):
+            (key, inner), = dct.items()
+            if type(inner) is _Base64Stream and not inner.read_once:
+                inner = inner.getvalue()
+            if isinstance(inner, string_types):
+                fragment = fragments.get(key)
+                if fragment is None:
+                    fragment = fragments[key] = u'{' + _encoder(key) + encoder.key_separator
+                return fragment + _encoder(inner) + u'}'
+        return encode(value)  # anything else is left to the encoder
+    return converter
+
+
+def _convert_column(serialiser, encoder, converters, values):
+    """
+    Return the jsonte text of each of values, looking up each type of value once (in converters, a dict of type ->
+    ( function from _make_value_converter , _standard_text_template ) that is filled in as needed) rather than for
+    each value.
+    """
+    encode = encoder.encode
+    value_types = set(map(type, values))
+    for value_type in value_types:
+        if value_type not in converters:
+            converters[value_type] = (_make_value_converter(serialiser, encoder, value_type),
+                                      _standard_text_template(
+                                          serialiser._resolve_type_serialiser(value_type, registry=encoder.registry),
+                                          encoder))
+    if len(value_types) == 1:
+        value_type, = value_types
+        converter, text_template = converters[value_type]
+        if converter is None or (value_type is float and not all(map(_isfinite, values))):
+            return map(encode, values)
+        if text_template is not None:
+            template, text_func = text_template
+            if value_type is datetime.date:
+                # dates repeat a lot, and equal dates always have the same text, so convert each one once
+                unique_values = set(values)
+                texts = dict(zip(unique_values, map(template.__mod__, map(text_func, unique_values))))
+                return map(texts.__getitem__, values)
+            return map(template.__mod__, map(text_func, values))
+        return map(converter, values)
+    # a mix of types, eg with None
+    value_converters = dict((value_type, encode if converters[value_type][0] is None or value_type is float
+                             else converters[value_type][0]) for value_type in value_types)
+    return map(_call, map(value_converters.__getitem__, map(type, values)), values)
+
+
+def _standard_text_template(func, encoder):
+    """
+    If func is one of the standard serialisers, whose text never needs escaping, return (template, text function),
+    where template % text_func(value) is the jsonte for a value, saving making a SerialisationDict for each value.
+    """
+    if func is None or func not in _STANDARD_TEXT_SERIALISERS:
+        return None
+    name, text_func = _STANDARD_TEXT_SERIALISERS[func]
+    template = (u'{' + _string_encoder(encoder)(name) + encoder.key_separator + u'"').replace(u'%', u'%%') + u'%s"}'
+    return template, text_func
+
+
+def _tuple_getter(items):
+    """ operator.itemgetter, but always returning a tuple """
+    if len(items) == 1:
+        item = items[0]
+        return lambda obj: (obj[item],)
+    elif not items:
+        return lambda obj: ()
+    return operator.itemgetter(*items)
+
+
+# ---- worker processes for dumps_many and loads_many
+
+_worker_serialiser = None
+
+
+def _init_worker(serialiser_state):
+    global _worker_serialiser
+    _worker_serialiser = pickle.loads(serialiser_state)
+
+
+def _worker_dumps(obj):
+    return _worker_serialiser.dumps(obj)
+
+
+def _worker_loads(s):
+    return _worker_serialiser.loads(s)
+
+
+# ---- deserialiser caches, see JsonteSerialiser.enable_cache
+
+class _LRUCache(object):
+    """ A least recently used cache of the values returned by a deserialiser, keyed on the text they came from """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._values = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def wrap(self, name, func):
+        """ Return func, the deserialiser for name, wrapped to use the cache """
+        values = self._values
+        move_to_end = getattr(values, 'move_to_end', None)  # Python 3 only
+
+        def caching_func(dct):
+            key = dct.get(name)
+            if len(dct) != 1 or not isinstance(key, string_types):
+                return func(dct)  # left to func to report, or (for other types of key) not cached
+            try:
+                value = values[key]
+            except KeyError:
+                pass
+            else:
+                self.hits += 1
+                try:
+                    if move_to_end is not None:
+                        move_to_end(key)
+                    else:
+                        values[key] = values.pop(key)
+                except KeyError:  # evicted by another thread
+                    pass
+                return value
+            value = func(dct)
+            self.misses += 1
+            values[key] = value
+            if len(values) > self.maxsize:
+                try:
+                    values.popitem(last=False)
+                    self.evictions += 1
+                except KeyError:  # emptied by another thread
+                    pass
+            return value
+        return caching_func
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._values),
+                'maxsize': self.maxsize, 'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+
+
+# ---- lazy decoding, see JsonteSerialiser.loads
+
+class _LazyTagged(object):
+    """ A tagged value (eg {"#num": "1.5"}) from loads(lazy=True), converted by its deserialiser when first needed """
+    __slots__ = ('raw', '_dict_to_obj_func', '_value')
+    _UNCONVERTED = object()
+
+    def __init__(self, dict_to_obj_func, raw):
+        self.raw = raw
+        self._dict_to_obj_func = dict_to_obj_func
+        self._value = self._UNCONVERTED
+
+    def value(self):
+        if self._value is self._UNCONVERTED:
+            self._value = self._dict_to_obj_func(dict(self.raw))  # a copy, as deserialisers may pop from it
+        return self._value
+
+    def _encodable(self, escape_char, chars_to_escape):
+        if self._value is self._UNCONVERTED:
+            return SerialisationDict(self.raw)
+        return self._value
+
+
+def _make_key_escaper(escape_char, reserved_initial_chars):
+    chars_to_escape = reserved_initial_chars + escape_char
+
+    def escape(key):
+        return escape_char + key if isinstance(key, string_types) and key[:1] and key[0] in chars_to_escape else key
+    return escape
+
+
+def _lazy_value(value, escape):
+    """ Return value as seen through a lazy container: tagged values converted, and lists wrapped """
+    value_type = type(value)
+    if value_type is _LazyTagged:
+        return value.value()
+    if value_type is list:
+        return JsonteLazyList(value, escape)
+    return value
+
+
+def _raw_value(value, escape):
+    value_type = type(value)
+    if value_type is _LazyTagged:
+        return dict(value.raw)
+    if value_type is JsonteLazyDict or value_type is JsonteLazyList:
+        return value.raw()
+    if value_type is list:
+        return [_raw_value(item, escape) for item in value]
+    return value
+
+
+class JsonteLazyDict(MutableMapping):
+    """
+    A dict-like object returned by loads(lazy=True).  Tagged values are kept as decoded from the json, and only
+    converted by their deserialiser when first accessed, after which the result is kept.  Arrays are similarly
+    wrapped in a JsonteLazyList when first accessed.  Can be passed to dump and dumps, which write out any tagged
+    values that have not been converted just as they were read.
+    """
+    __slots__ = ('_dct', '_escape')
+
+    def __init__(self, dct=None, escape=None):
+        self._dct = dict() if dct is None else dct
+        self._escape = escape
+
+    def __getitem__(self, key):
+        value = self._dct[key]
+        value_type = type(value)
+        if value_type is _LazyTagged:
+            return value.value()
+        if value_type is list:
+            value = self._dct[key] = JsonteLazyList(value, self._escape)
+        return value
+
+    def __setitem__(self, key, value):
+        self._dct[key] = value
+
+    def __delitem__(self, key):
+        del self._dct[key]
+
+    def __contains__(self, key):
+        return key in self._dct
+
+    def __iter__(self):
+        return iter(self._dct)
+
+    def __len__(self):
+        return len(self._dct)
+
+    def __repr__(self):
+        return 'JsonteLazyDict(%r)' % dict(self.items())
+
+    def raw(self):
+        """
+        Return the contents as plain json data, as json.loads would have returned them: with the keys escaped and
+        the tagged values unconverted, as they were read (even if they have since been converted)
+        """
+        escape = self._escape
+        if escape is None:
+            return dict((key, _raw_value(value, escape)) for key, value in self._dct.items())
+        return dict((escape(key), _raw_value(value, escape)) for key, value in self._dct.items())
+
+    def _encodable(self, escape_char, chars_to_escape):
+        if not escape_char:
+            return SerialisationDict(self._dct)
+        return SerialisationDict(
+            (escape_char + key if isinstance(key, string_types) and key[:1] and key[0] in chars_to_escape else key,
+             value) for key, value in self._dct.items())
+
+
+class JsonteLazyList(MutableSequence):
+    """ A list-like object returned by loads(lazy=True), converting tagged values on access as JsonteLazyDict does """
+    __slots__ = ('_items', '_escape')
+
+    def __init__(self, items=None, escape=None):
+        self._items = list() if items is None else items
+        self._escape = escape
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return JsonteLazyList(self._items[index], self._escape)
+        value = self._items[index]
+        value_type = type(value)
+        if value_type is _LazyTagged:
+            return value.value()
+        if value_type is list:
+            value = self._items[index] = JsonteLazyList(value, self._escape)
+        return value
+
+    def __setitem__(self, index, value):
+        self._items[index] = value
+
+    def __delitem__(self, index):
+        del self._items[index]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for index in range(len(self._items)):
+            yield self[index]
+
+    def insert(self, index, value):
+        self._items.insert(index, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, JsonteLazyList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'JsonteLazyList(%r)' % list(self)
+
+    def raw(self):
+        """ Return the contents as plain json data, as for JsonteLazyDict.raw """
+        escape = self._escape
+        return [_raw_value(item, escape) for item in self._items]
+
+    def _encodable(self, escape_char, chars_to_escape):
+        return self._items
+
+
+# ---- stats, see JsonteSerialiser.enable_stats
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def _class_name(cls):
+    if cls.__module__ in ('builtins', '__builtin__'):
+        return cls.__name__
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+class _JsonteStats(object):
+    """
+    Counters for a JsonteSerialiser.  Updates from different threads are not locked, so may occasionally be lost.
+    """
+    def __init__(self, sample_every):
+        self.sample_every = sample_every
+        self._calls = {'serialisers': dict(), 'deserialisers': dict()}  # -> name -> [ calls , sampled , seconds ]
+        self.objects = 0
+        self.unescaped_keys = 0
+        self.escaped_keys = 0
+
+    def reset(self):
+        for counts_by_name in self._calls.values():
+            for counts in counts_by_name.values():
+                counts[:] = [0, 0, 0.0]  # in place, as the wrappers hold on to them
+        self.objects = self.unescaped_keys = self.escaped_keys = 0
+
+    def wrap(self, kind, name, func):
+        """ Return func wrapped to count its calls, and time one in every sample_every of them """
+        counts = self._calls[kind].setdefault(name, [0, 0, 0.0])
+        sample_every = self.sample_every
+
+        def counting_func(arg):
+            counts[0] += 1
+            if counts[0] % sample_every:
+                return func(arg)
+            start = _timer()
+            try:
+                return func(arg)
+            finally:
+                counts[2] += _timer() - start
+                counts[1] += 1
+        return counting_func
+
+    def wrap_objecthook(self, objecthook, escape_char):
+        def counting_objecthook(dct):
+            self.objects += 1
+            if not escape_char or escape_char not in u''.join(dct):
+                return objecthook(dct)
+            keys_to_unescape = sum(1 for key in dct if key[:1] == escape_char)
+            obj = objecthook(dct)
+            if obj is dct:  # rather than converted to another type
+                self.unescaped_keys += keys_to_unescape
+            return obj
+        return counting_objecthook
+
+    def report(self):
+        report = dict()
+        for kind, counts_by_name in self._calls.items():
+            report[kind] = dict((name, {'calls': calls, 'time': seconds * calls / sampled if sampled else 0.0})
+                                for name, (calls, sampled, seconds) in counts_by_name.items() if calls)
+        report['objects'] = self.objects
+        report['unescaped_keys'] = self.unescaped_keys
+        report['escaped_keys'] = self.escaped_keys
+        return report
 
 
 class _JsonteEncoder(json.JSONEncoder):
@@ -194,36 +1332,804 @@ class _JsonteEncoder(json.JSONEncoder):
         self.jsonte_serialiser = jsonte_serialiser
         self.chars_to_escape = self.jsonte_serialiser.reserved_initial_chars + self.jsonte_serialiser.escape_char
         self.escape_char = self.jsonte_serialiser.escape_char
-        self.jsonte_type_serialisers = self.jsonte_serialiser._serialisers
-        if not self.jsonte_serialiser._finalised:
-            raise RuntimeError('use of dump or dumps when not JsonteSerialiser not finalised')
+        # the registered types as they were when the encoder was built, for the life of the encoder
+        self.registry = self.jsonte_serialiser._registry
+        self.jsonte_type_dispatch = self.registry.serialiser_dispatch
+        self.stats = self.jsonte_serialiser._stats
         json.JSONEncoder.__init__(self, skipkeys=skipkeys, ensure_ascii=ensure_ascii, check_circular=check_circular,
                                   allow_nan=allow_nan, sort_keys=sort_keys, indent=indent, separators=separators)
+        # each char to escape as it starts a key in the output (eg \\u00ac for a non ascii char with ensure_ascii)
+        _encoder = json.encoder.encode_basestring_ascii if self.ensure_ascii else json.encoder.encode_basestring
+        self._encoded_chars_to_escape = [_encoder(char)[1:-1] for char in self.chars_to_escape]
+        # matches a key starting with a char to escape, in output without indentation
+        self._output_key_to_escape_re = re.compile(u'(?:\\{|%s)"(?:%s)(?:[^"\\\\]|\\\\.)*"%s' % (
+            re.escape(self.item_separator), u'|'.join(map(re.escape, self._encoded_chars_to_escape)),
+            re.escape(self.key_separator)))
+
+    def _has_unescaped_keys(self, json_str, serialised_keys):
+        """
+        Check json_str (without indentation) for keys starting with a char to escape, other than those in
+        serialised_keys, which came from serialisers and so are already escaped.
+        """
+        serialised_key_count = _count_keys_to_escape(serialised_keys, self.chars_to_escape)
+        if sum(json_str.count(u'"' + encoded) for encoded in self._encoded_chars_to_escape) == serialised_key_count:
+            return False  # the common case, and much quicker than the regex
+        return sum(1 for match in self._output_key_to_escape_re.finditer(json_str)) != serialised_key_count
 
     def default(self, obj):
-        for cls, obj_to_jsontedict_func in self.jsonte_type_serialisers:
-            if isinstance(obj, cls):
-                value = obj_to_jsontedict_func(obj)
-                if not isinstance(value, PreEscapedKeysMixin) or not isinstance(value, dict):
-                    raise TypeError('serialisers must return subclass of both dict and PreEscapedKeysMixin')
-                return value
+        # __class__ rather than type, which is the same for all instances of Python 2 old style classes
+        obj_cls = obj.__class__
+        try:
+            obj_to_jsontedict_func = self.jsonte_type_dispatch[obj_cls]
+        except KeyError:
+            obj_to_jsontedict_func = self.jsonte_serialiser._resolve_type_serialiser(obj_cls, obj, self.registry)
+        if obj_to_jsontedict_func is not None:
+            value = obj_to_jsontedict_func(obj)
+            if not isinstance(value, PreEscapedKeysMixin) or not isinstance(value, dict):
+                raise TypeError('serialisers must return subclass of both dict and PreEscapedKeysMixin')
+            return value
+        if isinstance(obj, JsonteRaw):
+            raise _NeedsPythonEncoder()  # as the C encoder can't write it out as it is
+        if isinstance(obj, (JsonteLazyDict, JsonteLazyList, _LazyTagged)):
+            # re-emit loads(lazy=True) results, leaving unconverted tagged values as they were
+            return obj._encodable(self.escape_char, self.chars_to_escape)
+        if isinstance(obj, _Base64Stream):
+            # only the C encoder gets here, as the Python encoder writes these out a chunk at a time
+            if obj.read_once:
+                raise _NeedsPythonEncoder()  # so that the Python encoder can read it instead
+            return obj.getvalue()
         return json.JSONEncoder.default(self, obj)
 
     def iterencode(self, obj, _one_shot=False):
-        if isinstance(obj, dict) and not isinstance(obj, PreEscapedKeysMixin) and self.jsonte_serialiser.escape_char:
-            # prefix any keys starting with something in reserved_initial_chars with the escape char
-            keys_to_escape = [key for key in obj if isinstance(key, string_types) and key[0] in self.chars_to_escape]
-            if keys_to_escape:
-                new_dct = obj.copy()
-                for key in keys_to_escape:
-                    new_dct[self.escape_char + key] = new_dct.pop(key)
-                obj = new_dct
-
-        # handle Python 2.6 without _oneshot, and future version with
-        if _one_shot:
-            return json.JSONEncoder.iterencode(self, obj, _one_shot)
+        if self.check_circular:
+            markers = {}
+        else:
+            markers = None
+        if self.ensure_ascii:
+            _encoder = json.encoder.encode_basestring_ascii
+        else:
+            _encoder = json.encoder.encode_basestring
+
+        default = self.default
+        if _one_shot and _c_make_encoder is not None and self.indent is None:
+            # The C encoder can't escape keys, so use it and then check that every key in the output starting with
+            # a char to escape came from a serialiser (the common case). Otherwise convert and escape the object in
+            # one pass and use the C encoder on that, as engine='preconvert' does.
+            # Keys needing escaping are most often at the top level, so escape those first in a shallow copy.
+            c_obj = obj
+            top_level_escaped_keys = 0
+            if self.escape_char and isinstance(obj, dict) and not isinstance(obj, PreEscapedKeysMixin):
+                top_level_escaped_keys = _count_keys_to_escape(obj, self.chars_to_escape)
+                if top_level_escaped_keys:
+                    escape = _make_key_escaper(self.escape_char, self.jsonte_serialiser.reserved_initial_chars)
+                    c_obj = dict((escape(key), value) for key, value in obj.items())
+            serialised_keys = list(c_obj) if c_obj is not obj else list()  # keys that are already escaped
+            # with stats, tuples ( object , value from default ) for reuse if falling back, so that the serialisers
+            # of objects already converted aren't called (and counted) again
+            converted_values = None if self.stats is None else list()
+
+            def _default(o):
+                value = default(o)
+                if converted_values is not None:
+                    converted_values.append((o, value))
+                if isinstance(value, dict):
+                    serialised_keys.extend(value)
+                return value
+
+            _iterencode = _c_make_encoder(markers, _default, _encoder, self.indent,
+                                          self.key_separator, self.item_separator, self.sort_keys,
+                                          self.skipkeys, self.allow_nan)
+            try:
+                json_str = u''.join(_iterencode(c_obj, 0))
+            except _NeedsPythonEncoder:
+                pass
+            else:
+                if not self.escape_char or not self._has_unescaped_keys(json_str, serialised_keys):
+                    if top_level_escaped_keys and self.stats is not None:
+                        self.stats.escaped_keys += top_level_escaped_keys
+                    return [json_str]
+                if markers is not None:
+                    markers.clear()
+                json_str = self._preconvert_encode(obj, markers, _encoder, _reusing_default(default, converted_values))
+                if json_str is not None:
+                    return [json_str]
+            if markers is not None:
+                markers.clear()
+            default = _reusing_default(default, converted_values)
+        return self._python_iterencode(obj, markers, _encoder, default)
+
+    def _python_iterencode(self, obj, markers, _encoder, default):
+        """ Return an iterator of the chunks of obj encoded by the Python encoder, calling default for other types """
+        def floatstr(o, allow_nan=self.allow_nan, _repr=float.__repr__, _inf=float('inf'), _neginf=-float('inf')):
+            if o != o:
+                text = 'NaN'
+            elif o == _inf:
+                text = 'Infinity'
+            elif o == _neginf:
+                text = '-Infinity'
+            else:
+                return _repr(o)
+            if not allow_nan:
+                raise ValueError('Out of range float values are not JSON compliant: ' + repr(o))
+            return text
+
+        _iterencode = _make_jsonte_iterencode(markers, default, _encoder, self.indent, floatstr,
+                                              self.key_separator, self.item_separator, self.sort_keys,
+                                              self.skipkeys, self.escape_char, self.chars_to_escape, self.stats)
+        return _iterencode(obj, 0)
+
+    def _preconvert_encode(self, obj, markers, _encoder, default):
+        """
+        Return obj encoded by the C encoder after converting the registered types (with default) and escaping the keys
+        in a single pass (see _make_jsonte_preconvert), or None if it has something only the Python encoder can write
+        out.
+        """
+        escaped_key_counts = None if self.stats is None else list()
+        _preconvert = _make_jsonte_preconvert(markers, default, self.escape_char, self.chars_to_escape,
+                                              escaped_key_counts)
+        try:
+            converted = _preconvert(obj)
+        except _NeedsPythonEncoder:
+            return None  # without counting the escaped keys, which the Python encoder will count
+        if escaped_key_counts:
+            self.stats.escaped_keys += sum(escaped_key_counts)
+        # the copy can't have any circular references, as they would have been found while converting
+        _iterencode = _c_make_encoder(None, self.default, _encoder, self.indent,
+                                      self.key_separator, self.item_separator, self.sort_keys,
+                                      self.skipkeys, self.allow_nan)
+        return u''.join(_iterencode(converted, 0))
+
+
+_c_make_encoder = getattr(json.encoder, 'c_make_encoder', None)
+
+
+def _recording_default(default, converted_values):
+    """ Return default, changed to append ( object , value returned ) to converted_values, unless that is None """
+    if converted_values is None:
+        return default
+
+    def _recording_default(o):
+        value = default(o)
+        converted_values.append((o, value))
+        return value
+    return _recording_default
+
+
+def _reusing_default(default, converted_values):
+    """
+    Return default, changed to return the value already converted for any object in converted_values, a list of tuples
+    ( object , value returned by default ), rather than calling default again
+    """
+    if not converted_values:
+        return default
+    values = dict((id(obj), value) for obj, value in converted_values)  # the objects are kept alive by the list
+
+    def _reusing_default(o):
+        value = values.get(id(o))
+        return default(o) if value is None else value
+    return _reusing_default
+
+
+class _NeedsPythonEncoder(Exception):
+    """ Raised from within the C encoder to have the object encoded by the Python encoder instead """
+    pass
+
+
+def _count_keys_to_escape(keys, chars_to_escape):
+    return sum(1 for key in keys if isinstance(key, string_types) and key[:1] and key[0] in chars_to_escape)
+
+
+def _make_jsonte_iterencode(markers, _default, _encoder, _indent, _floatstr,
+                            _key_separator, _item_separator, _sort_keys, _skipkeys, _escape_char, _chars_to_escape,
+                            _stats=None,
+                            # turn globals into locals, as json does
+                            ValueError=ValueError,
+                            dict=dict,
+                            float=float,
+                            id=id,
+                            integer_types=integer_types,
+                            isinstance=isinstance,
+                            list=list,
+                            string_types=string_types,
+                            tuple=tuple,
+                            _intstr=int.__repr__ if PY3 else str):
+    """
+    json.encoder._make_iterencode, but with keys escaped as each dict is written out,
+    so that no escaped copies of dicts need to be made.
+    """
+    if _indent is not None and not isinstance(_indent, string_types):
+        _indent = ' ' * _indent
+
+    def _iterencode_list(lst, _current_indent_level):
+        if not lst:
+            yield '[]'
+            return
+        if markers is not None:
+            markerid = id(lst)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = lst
+        buf = '['
+        if _indent is not None:
+            _current_indent_level += 1
+            newline_indent = '\n' + _indent * _current_indent_level
+            separator = _item_separator + newline_indent
+            buf += newline_indent
+        else:
+            newline_indent = None
+            separator = _item_separator
+        first = True
+        for value in lst:
+            if first:
+                first = False
+            else:
+                buf = separator
+            if isinstance(value, string_types):
+                yield buf + _encoder(value)
+            elif value is None:
+                yield buf + 'null'
+            elif value is True:
+                yield buf + 'true'
+            elif value is False:
+                yield buf + 'false'
+            elif isinstance(value, integer_types):
+                yield buf + _intstr(value)
+            elif isinstance(value, float):
+                yield buf + _floatstr(value)
+            else:
+                yield buf
+                if isinstance(value, (list, tuple)):
+                    chunks = _iterencode_list(value, _current_indent_level)
+                elif isinstance(value, dict):
+                    chunks = _iterencode_dict(value, _current_indent_level)
+                else:
+                    chunks = _iterencode(value, _current_indent_level)
+                for chunk in chunks:
+                    yield chunk
+        if newline_indent is not None:
+            _current_indent_level -= 1
+            yield '\n' + _indent * _current_indent_level
+        yield ']'
+        if markers is not None:
+            del markers[markerid]
+
+    def _escaped_items(dct):
+        if not _escape_char or isinstance(dct, PreEscapedKeysMixin):
+            return dct.items()
+        return ((_escape_char + key if isinstance(key, string_types) and key[:1] and key[0] in _chars_to_escape
+                 else key, value) for key, value in dct.items())
+
+    if _stats is not None:
+        _uncounted_escaped_items = _escaped_items
+
+        def _escaped_items(dct):
+            if _escape_char and not isinstance(dct, PreEscapedKeysMixin):
+                _stats.escaped_keys += _count_keys_to_escape(dct, _chars_to_escape)
+            return _uncounted_escaped_items(dct)
+
+    def _iterencode_dict(dct, _current_indent_level):
+        if not dct:
+            yield '{}'
+            return
+        if markers is not None:
+            markerid = id(dct)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = dct
+        yield '{'
+        if _indent is not None:
+            _current_indent_level += 1
+            newline_indent = '\n' + _indent * _current_indent_level
+            item_separator = _item_separator + newline_indent
+            yield newline_indent
+        else:
+            newline_indent = None
+            item_separator = _item_separator
+        first = True
+        if _sort_keys:
+            items = sorted(_escaped_items(dct))
+        else:
+            items = _escaped_items(dct)
+        for key, value in items:
+            if isinstance(key, string_types):
+                pass
+            elif isinstance(key, float):
+                key = _floatstr(key)
+            elif key is True:
+                key = 'true'
+            elif key is False:
+                key = 'false'
+            elif key is None:
+                key = 'null'
+            elif isinstance(key, integer_types):
+                key = _intstr(key)
+            elif _skipkeys:
+                continue
+            else:
+                raise TypeError('key %r is not a string' % (key,))
+            if first:
+                first = False
+            else:
+                yield item_separator
+            yield _encoder(key)
+            yield _key_separator
+            if isinstance(value, string_types):
+                yield _encoder(value)
+            elif value is None:
+                yield 'null'
+            elif value is True:
+                yield 'true'
+            elif value is False:
+                yield 'false'
+            elif isinstance(value, integer_types):
+                yield _intstr(value)
+            elif isinstance(value, float):
+                yield _floatstr(value)
+            else:
+                if isinstance(value, (list, tuple)):
+                    chunks = _iterencode_list(value, _current_indent_level)
+                elif isinstance(value, dict):
+                    chunks = _iterencode_dict(value, _current_indent_level)
+                else:
+                    chunks = _iterencode(value, _current_indent_level)
+                for chunk in chunks:
+                    yield chunk
+        if newline_indent is not None:
+            _current_indent_level -= 1
+            yield '\n' + _indent * _current_indent_level
+        yield '}'
+        if markers is not None:
+            del markers[markerid]
+
+    def _iterencode(o, _current_indent_level):
+        if isinstance(o, string_types):
+            yield _encoder(o)
+        elif o is None:
+            yield 'null'
+        elif o is True:
+            yield 'true'
+        elif o is False:
+            yield 'false'
+        elif isinstance(o, integer_types):
+            yield _intstr(o)
+        elif isinstance(o, float):
+            yield _floatstr(o)
+        elif isinstance(o, (list, tuple)):
+            for chunk in _iterencode_list(o, _current_indent_level):
+                yield chunk
+        elif isinstance(o, dict):
+            for chunk in _iterencode_dict(o, _current_indent_level):
+                yield chunk
+        elif isinstance(o, _Base64Stream):
+            yield '"'
+            for chunk in o.iter_chunks():
+                yield chunk
+            yield '"'
+        elif isinstance(o, JsonteRaw):
+            yield o.text
+        elif isinstance(o, (JsonteLazyDict, JsonteLazyList, _LazyTagged)):
+            for chunk in _iterencode(o._encodable(_escape_char, _chars_to_escape), _current_indent_level):
+                yield chunk
+        else:
+            if markers is not None:
+                markerid = id(o)
+                if markerid in markers:
+                    raise ValueError('Circular reference detected')
+                markers[markerid] = o
+            o = _default(o)
+            for chunk in _iterencode(o, _current_indent_level):
+                yield chunk
+            if markers is not None:
+                del markers[markerid]
+    return _iterencode
+
+
+class _PreconvertJsonteEncoder(_JsonteEncoder):
+    """
+    Encoder for engine='preconvert'.  encode (and so dumps) first makes a converted copy of the object, with the
+    registered types converted and the keys escaped, in a single pass, and then encodes that with the C encoder, which
+    then has nothing to call back for and no keys to check.  iterencode (used by dump) streams as _JsonteEncoder does.
+    """
+    def iterencode(self, obj, _one_shot=False):
+        if _one_shot and _c_make_encoder is not None and self.indent is None:
+            if self.ensure_ascii:
+                _encoder = json.encoder.encode_basestring_ascii
+            else:
+                _encoder = json.encoder.encode_basestring
+            markers = {} if self.check_circular else None
+            converted_values = None if self.stats is None else list()  # as for _JsonteEncoder.iterencode
+            json_str = self._preconvert_encode(obj, markers, _encoder,
+                                               _recording_default(self.default, converted_values))
+            if json_str is not None:
+                return [json_str]
+            if markers is not None:
+                markers.clear()
+            return self._python_iterencode(obj, markers, _encoder, _reusing_default(self.default, converted_values))
+        return _JsonteEncoder.iterencode(self, obj, _one_shot)
+
+
+def _make_jsonte_preconvert(markers, _default, _escape_char, _chars_to_escape, _escaped_key_counts=None,
+                            # turn globals into locals
+                            ValueError=ValueError,
+                            dict=dict,
+                            float=float,
+                            id=id,
+                            integer_types=integer_types,
+                            isinstance=isinstance,
+                            list=list,
+                            string_types=string_types,
+                            tuple=tuple,
+                            type=type):
+    """
+    Return a function that copies an object into one of only json types, calling _default for any other objects (so
+    registered types are converted) and escaping the keys of each dict that isn't already escaped.
+    If _escaped_key_counts is a list, the number of keys escaped in each dict is appended to it.
+    """
+    plain_classes = string_types + integer_types + (float,)
+    plain_types = frozenset(plain_classes + (bool, type(None)))
+    escape_set = frozenset(_chars_to_escape)
+
+    def _convert_list(lst):
+        if markers is not None:
+            markerid = id(lst)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = lst
+        converted = [value if type(value) in plain_types else _convert(value) for value in lst]
+        if markers is not None:
+            del markers[markerid]
+        return converted
+
+    def _convert_dict(dct):
+        if markers is not None:
+            markerid = id(dct)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = dct
+        if not _escape_char or isinstance(dct, PreEscapedKeysMixin):
+            converted = dict((key, value if type(value) in plain_types else _convert(value))
+                             for key, value in dct.items())
+        else:
+            converted = dict((_escape_char + key if isinstance(key, string_types) and key[:1] in escape_set else key,
+                              value if type(value) in plain_types else _convert(value))
+                             for key, value in dct.items())
+        if markers is not None:
+            del markers[markerid]
+        return converted
+
+    if _escaped_key_counts is not None:
+        _uncounted_convert_dict = _convert_dict
+
+        def _convert_dict(dct):
+            if _escape_char and not isinstance(dct, PreEscapedKeysMixin):
+                _escaped_key_counts.append(_count_keys_to_escape(dct, _chars_to_escape))
+            return _uncounted_convert_dict(dct)
+
+    def _convert(o):
+        # checked in the same order as the json encoders
+        if o is None or isinstance(o, plain_classes):
+            return o
+        elif isinstance(o, (list, tuple)):
+            return _convert_list(o)
+        elif isinstance(o, dict):
+            return _convert_dict(o)
+        if markers is not None:
+            markerid = id(o)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = o
+        converted = _convert(_default(o))
+        if markers is not None:
+            del markers[markerid]
+        return converted
+    return _convert
+
+
+# the encoders used by dump and dumps, for JsonteSerialiser's engine parameter
+_ENGINES = {
+    'json': _JsonteEncoder,
+    'preconvert': _PreconvertJsonteEncoder,
+}
+
+
+# ---- incremental decoding
+
+_WHITESPACE_RE = re.compile(u'[ \\t\\n\\r]*')
+
+
+_JSONDecodeError = getattr(json, 'JSONDecodeError', None)  # Python 3.5+
+_DECODE_ERROR_RE = re.compile(u'(.*): line \\d+ column \\d+ \\(char (\\d+)')  # for earlier versions
+_NUMBER_CHARS_RE = re.compile(u'[0-9.eE+-]*')
+_MAX_CUT_OFF_LEN = 8  # the most chars of a partly read number or literal (eg -Infinit) that json can't decode
+
+
+def _is_cut_off(error, text):
+    """
+    Whether error, raised decoding text, is a syntax error that could be because text is cut off, rather than invalid
+    json or an error from a deserialiser: one at (or just before, for a partly read number or literal) the end of text,
+    or a string without its closing quote.
+    """
+    if _JSONDecodeError is not None:
+        if not isinstance(error, _JSONDecodeError):
+            return False
+        message, pos = error.msg, error.pos
+    else:
+        match = _DECODE_ERROR_RE.match(str(error))
+        if match is None:
+            return False
+        message, pos = match.group(1), int(match.group(2))
+    return pos >= len(text) - _MAX_CUT_OFF_LEN or message.startswith('Unterminated string')
+
+
+class _ArrayItemParser(object):
+    """
+    Incremental parser for the items of the array at path within a json document that is fed in as pieces of text.
+    Objects along the path are only parsed as far as the key leading to the array, and parsing stops at the end of
+    the array, so neither anything else in the document nor more than around one item is held in memory.
+    """
+    _NEED_MORE = object()
+
+    def __init__(self, decoder, path=None, escape_char=u'~', websafety_prefix=None):
+        self._decoder = decoder
+        self._skip_decoder = json.JSONDecoder()
+        self._path = list(path or ())
+        self._escape_char = escape_char
+        self._websafety_prefix = websafety_prefix
+        self._state = 'start'
+        self._buf = u''
+        self._pos = 0
+        self._retry_len = 0  # don't try decoding a value again until the buffer is at least this long
+        self._cut_off = False  # whether the current value has been found to be cut off
+
+    @property
+    def done(self):
+        return self._state == 'done'
+
+    def feed(self, text):
+        """ Add the next piece of the document, returning a list of any items that are now complete """
+        self._buf += text
+        return self._parse(False)
+
+    def close(self):
+        """ Mark the end of the document, returning a list of any remaining items """
+        items = self._parse(True)
+        if self._state != 'done':
+            raise ValueError('unexpected end of data, while looking for %s' % (
+                'key %r' % self._path[0] if self._path and self._state in ('first_key', 'key', 'after_member')
+                else 'the end of the array'))
+        return items
+
+    def _skip_whitespace(self):
+        self._pos = _WHITESPACE_RE.match(self._buf, self._pos).end()
+        return self._pos < len(self._buf)
+
+    def _expect(self, chars):
+        char = self._buf[self._pos]
+        if char not in chars:
+            raise ValueError('expected %s, not %r' % (u' or '.join(chars), char))
+        self._pos += 1
+        return char
+
+    def _raw_decode(self, decoder, eof):
+        buf, pos = self._buf, self._pos
+        if not eof and len(buf) < self._retry_len:
+            return self._NEED_MORE
+        try:
+            if self._cut_off and not eof and decoder is not self._skip_decoder:
+                # check that the rest of the value is here first, without calling the object hook on part of it again
+                self._skip_decoder.raw_decode(buf, pos)
+            value, end = decoder.raw_decode(buf, pos)
+        except ValueError as e:
+            if eof or not _is_cut_off(e, buf):
+                raise
+            # wait until there is twice as much before trying again (keeps retries linear)
+            self._cut_off = True
+            self._retry_len = pos + 2 * (len(buf) - pos)
+            return self._NEED_MORE
+        if not eof and _NUMBER_CHARS_RE.match(buf, end).end() == len(buf):
+            # a number at the end of the buffer may carry on in the next piece (eg 12.5 read as 12 from '12.')
+            self._retry_len = len(buf) + 1
+            return self._NEED_MORE
+        self._pos = end
+        self._retry_len = 0
+        self._cut_off = False
+        return value
+
+    def _parse(self, eof):
+        items = list()
+        while self._state != 'done':
+            if self._state == 'start':
+                prefix = self._websafety_prefix
+                if prefix and not eof and len(self._buf) < len(prefix):
+                    break
+                if prefix and self._buf.startswith(prefix):
+                    self._pos += len(prefix)
+                self._state = 'value'
+            elif not self._skip_whitespace():
+                break
+            elif self._state == 'value':
+                if self._path:
+                    self._expect(u'{')
+                    self._state = 'first_key'
+                else:
+                    self._expect(u'[')
+                    self._state = 'first_item'
+            elif self._state in ('first_key', 'key'):
+                if self._state == 'first_key' and self._buf[self._pos] == u'}':
+                    raise ValueError('key %r not found' % self._path[0])
+                self._expect(u'"')
+                try:
+                    key, end = json.decoder.scanstring(self._buf, self._pos)
+                except ValueError:
+                    if eof:
+                        raise
+                    self._pos -= 1
+                    break
+                end = _WHITESPACE_RE.match(self._buf, end).end()
+                if end == len(self._buf):
+                    self._pos -= 1
+                    break
+                self._pos = end
+                self._expect(u':')
+                if self._escape_char and key[:1] == self._escape_char:
+                    key = key[1:]
+                if key == self._path[0]:
+                    self._path.pop(0)
+                    self._state = 'value'
+                else:
+                    self._state = 'skip_value'
+            elif self._state == 'skip_value':
+                if self._raw_decode(self._skip_decoder, eof) is self._NEED_MORE:
+                    break
+                self._state = 'after_member'
+            elif self._state == 'after_member':
+                if self._expect(u',}') == u'}':
+                    raise ValueError('key %r not found' % self._path[0])
+                self._state = 'key'
+            elif self._state == 'first_item' and self._buf[self._pos] == u']':
+                self._pos += 1
+                self._state = 'done'
+            elif self._state in ('first_item', 'item'):
+                item = self._raw_decode(self._decoder, eof)
+                if item is self._NEED_MORE:
+                    break
+                items.append(item)
+                self._state = 'after_item'
+            elif self._state == 'after_item':
+                self._state = 'item' if self._expect(u',]') == u',' else 'done'
+        # drop what has been parsed, so the buffer only holds the current (incomplete) value
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._retry_len = max(0, self._retry_len - self._pos)
+            self._pos = 0
+        return items
+
+
+def _decode_with_raw_paths(s, pos, decoder, objecthook, paths, escape_char, _skip_decoder=json.JSONDecoder()):
+    """
+    Decode the value starting at s[pos] with decoder, except for the values at the key paths (from this value), which
+    are returned as JsonteRaw.  The objects leading to them are parsed here, calling objecthook for each.
+    Returns the value and the index of the end of it.
+    """
+    if s[pos:pos + 1] != u'{':
+        return decoder.raw_decode(s, pos)  # no keys for the paths to lead through
+    pos = _WHITESPACE_RE.match(s, pos + 1).end()
+    pairs = list()
+    char = s[pos:pos + 1]
+    while char != u'}':
+        if char != u'"':
+            raise ValueError('expected a key at char %d' % pos)
+        key, pos = json.decoder.scanstring(s, pos + 1)
+        pos = _WHITESPACE_RE.match(s, pos).end()
+        if s[pos:pos + 1] != u':':
+            raise ValueError('expected : at char %d' % pos)
+        pos = _WHITESPACE_RE.match(s, pos + 1).end()
+        unescaped_key = key[1:] if escape_char and key[:1] == escape_char else key
+        sub_paths = [path[1:] for path in paths if path[0] == unescaped_key]
+        if not sub_paths:
+            value, pos = decoder.raw_decode(s, pos)
+        elif not all(sub_paths):
+            # the C scanner finds the end of the value quickly, as it doesn't convert anything
+            end = _skip_decoder.raw_decode(s, pos)[1]
+            value = JsonteRaw(s[pos:end])
+            pos = end
+        else:
+            value, pos = _decode_with_raw_paths(s, pos, decoder, objecthook, sub_paths, escape_char)
+        pairs.append((key, value))
+        pos = _WHITESPACE_RE.match(s, pos).end()
+        char = s[pos:pos + 1]
+        if char == u',':
+            pos = _WHITESPACE_RE.match(s, pos + 1).end()
+            char = s[pos:pos + 1]
+            if char == u'}':
+                raise ValueError('expected a key at char %d' % pos)
+        elif char != u'}':
+            raise ValueError('expected , or } at char %d' % pos)
+    return objecthook(dict(pairs)), pos + 1
+
+
+# ---- indexing files, for JsonteFile
+
+_BYTES_WHITESPACE_RE = re.compile(b'[ \\t\\n\\r]*')
+_NON_BLANK_LINE_RE = re.compile(b'[^\\n]*[^ \\t\\r\\n][^\\n]*')
+_OFFSET_TYPECODE = 'q' if 'q' in getattr(array, 'typecodes', '') else 'l'  # 'q' is Python 3.3+
+
+
+def _index_json_array(data, pos, chunk_size):
+    """
+    Return arrays of the start and end offsets of the items of the json array starting at data[pos] (its '[').
+    Pieces of data are decoded as latin-1, so that offsets into the text are offsets into data (utf-8 sequences just
+    become runs of non-ascii chars within strings), and each item is skipped with the C json scanner, which checks it
+    and builds plain json values (which are dropped) but doesn't call the object hook or convert anything.
+    """
+    if data[pos:pos + 1] != b'[':
+        raise ValueError('expected a top-level array')
+    skip_decoder = json.JSONDecoder()
+    starts = array.array(_OFFSET_TYPECODE)
+    ends = array.array(_OFFSET_TYPECODE)
+    size = len(data)
+    window = chunk_size
+    text_start = pos + 1  # offset in data of text[0]
+    text = data[text_start:text_start + window].decode('latin-1')
+    i = 0
+    expect_item = first = True
+    while True:
+        i = _WHITESPACE_RE.match(text, i).end()
+        if i == len(text):
+            if text_start + i >= size:
+                raise ValueError('unexpected end of data, while looking for the end of the array')
+            text_start += i
+            text = data[text_start:text_start + window].decode('latin-1')
+            i = 0
+        elif expect_item:
+            if first and text[i] == u']':
+                i += 1
+                break
+            at_eof = text_start + len(text) >= size
+            try:
+                end = skip_decoder.raw_decode(text, i)[1]
+            except ValueError as e:
+                if at_eof or not _is_cut_off(e, text):
+                    raise
+                end = None
+            if end is None or (not at_eof and _NUMBER_CHARS_RE.match(text, end).end() == len(text)):
+                # presumably cut off (or a number that may carry on), so read again from the item's start, with
+                # twice as much if needed (keeping the number of rescans for a large item logarithmic)
+                window = max(window, 2 * (len(text) - i))
+                text_start += i
+                text = data[text_start:text_start + window].decode('latin-1')
+                i = 0
+                continue
+            starts.append(text_start + i)
+            ends.append(text_start + end)
+            i = end
+            expect_item = first = False
         else:
-            return json.JSONEncoder.iterencode(self, obj)
+            char = text[i]
+            i += 1
+            if char == u']':
+                break
+            if char != u',':
+                raise ValueError('expected , or ] at byte %d' % (text_start + i - 1))
+            expect_item = True
+    end = text_start + i
+    if _BYTES_WHITESPACE_RE.match(data, end).end() != size:
+        raise ValueError('extra data after the array, at byte %d' % end)
+    return starts, ends
+
+
+def _index_json_lines(data, websafety_prefix):
+    """ Return arrays of the start and end offsets of the non-blank lines of data, skipping a websafety prefix """
+    starts = array.array(_OFFSET_TYPECODE)
+    ends = array.array(_OFFSET_TYPECODE)
+    prefix = websafety_prefix.strip().encode('utf-8')
+    for match in _NON_BLANK_LINE_RE.finditer(data):
+        start, end = match.span()
+        if not starts and data[start:end].strip() == prefix:
+            continue
+        starts.append(start)
+        ends.append(end)
+    return starts, ends
 
 
 # ---- inbuilt types 
@@ -250,7 +2156,11 @@ def timestamp_serialiser(tstamp):
 
 
 def timestamp_deserialiser(dct):
-    value = dateutil.parser.parse(dct.pop('#tstamp'))
+    text = dct.pop('#tstamp')
+    value = _parse_iso_timestamp(text)
+    if value is None:
+        import dateutil.parser
+        value = dateutil.parser.parse(text)
     if dct:
         raise ValueError('Invalid #tstamp')  # should be an empty dct
     return value
@@ -278,21 +2188,211 @@ def time_serialiser(the_time):
 
 
 def time_deserialiser(dct):
-    value = dateutil.parser.parse(dct.pop('#time')).time()
+    text = dct.pop('#time')
+    value = _parse_iso_time(text)
+    if value is None:
+        import dateutil.parser
+        value = dateutil.parser.parse(text).time()
     if dct:
         raise ValueError('Invalid #time')  # should be an empty dct
     return value
 
 
-# binary  ( python bytearray - 2.6 and higher )
+# the standard serialisers above, whose text never needs escaping -> ( type name , function returning the text )
+_STANDARD_TEXT_SERIALISERS = {
+    decimal_serialiser: ('#num', str),
+    timestamp_serialiser: ('#tstamp', operator.methodcaller('isoformat')),
+    date_serialiser: ('#date', operator.methodcaller('isoformat')),
+    time_serialiser: ('#time', operator.methodcaller('isoformat')),
+}
+
+
+# binary  ( python bytearray - 2.6 and higher, and bytes, memoryview or anything else supporting the buffer protocol )
+# ( a file like object or an iterable of bytes can also be registered, and will be read when encoded )
 def binary_serialiser(bin_data):
     dct = SerialisationDict()
-    dct[u'#bin'] = base64.b64encode(bytes(bin_data)).decode('ascii')
+    dct[u'#bin'] = _Base64Stream(bin_data)
     return dct
 
 
 def binary_deserialiser(dct):
-    value = bytearray(base64.b64decode(dct.pop('#bin')))
+    return bytearray(binary_bytes_deserialiser(dct))
+
+
+def binary_bytes_deserialiser(dct):
+    value = binascii.a2b_base64(dct.pop('#bin'))  # unlike base64.b64decode, doesn't copy the text first
     if dct:
         raise ValueError('Invalid #bin')  # should be an empty dct
     return value
+
+
+def binary_memoryview_deserialiser(dct):
+    return memoryview(binary_bytes_deserialiser(dct))
+
+
+_BINARY_DESERIALISERS = {'bytearray': binary_deserialiser,
+                         'bytes': binary_bytes_deserialiser,
+                         'memoryview': binary_memoryview_deserialiser}
+
+# the standard types, shared by every JsonteSerialiser, in the order kept by add_type_serialiser (subclasses first)
+_STANDARD_SERIALISERS = ((decimal.Decimal, decimal_serialiser),
+                         (datetime.datetime, timestamp_serialiser),
+                         (datetime.date, date_serialiser),
+                         (datetime.time, time_serialiser),
+                         (bytearray, binary_serialiser),
+                         (memoryview, binary_serialiser))
+if PY3:  # bytes is str in Python 2
+    _STANDARD_SERIALISERS += ((bytes, binary_serialiser),)
+
+# ( #bin depends on binary_type, see _BINARY_DESERIALISERS )
+_STANDARD_DESERIALISERS = {'#num': decimal_deserialiser,
+                           '#tstamp': timestamp_deserialiser,
+                           '#date': date_deserialiser,
+                           '#time': time_deserialiser}
+
+
+def _getmro(cls):
+    try:
+        return cls.__mro__
+    except AttributeError:  # Python 2 old style classes
+        import inspect
+        return inspect.getmro(cls)
+
+
+def _supports_buffer(obj):
+    try:
+        memoryview(obj)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _byte_view(bin_data):
+    """ The bytes of a buffer protocol object as a flat memoryview, copying only if they are not contiguous """
+    view = memoryview(bin_data)
+    if not PY3:
+        return view.tobytes()
+    if not view.c_contiguous:
+        return view.tobytes()
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+    return view
+
+
+class _Base64Stream(object):
+    """
+    The base64 encoded text of some binary data, which the Python encoder (ie dump) writes out a chunk at a time.
+    The source can support the buffer protocol, or be a file like object or an iterable of bytes, which are only read
+    when encoded (and so can only be encoded once).
+    """
+    chunk_size = 3 * 16384  # bytes of source data per chunk, a multiple of 3 so chunks can be encoded separately
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            self._view = _byte_view(source)
+        except TypeError:
+            self._view = None
+        self.read_once = self._view is None
+
+    def getvalue(self):
+        if self._view is not None:
+            return base64.b64encode(self._view).decode('ascii')
+        return u''.join(self.iter_chunks())
+
+    def iter_chunks(self):
+        chunk_size = self.chunk_size
+        view = self._view
+        if view is not None:
+            for start in range(0, len(view), chunk_size):
+                yield base64.b64encode(view[start:start + chunk_size]).decode('ascii')
+            return
+        leftover = b''
+        for piece in self._iter_source_pieces():
+            if leftover:
+                piece = b''.join((leftover, piece))
+            whole_length = len(piece) - len(piece) % 3
+            if whole_length:
+                yield base64.b64encode(memoryview(piece)[:whole_length]).decode('ascii')
+            leftover = bytes(piece[whole_length:])
+        if leftover:
+            yield base64.b64encode(leftover).decode('ascii')
+
+    def _iter_source_pieces(self):
+        if hasattr(self.source, 'read'):
+            while True:
+                piece = self.source.read(self.chunk_size)
+                if not piece:
+                    break
+                yield piece
+        else:
+            for piece in self.source:
+                yield piece
+
+
+# the types the encoders write out themselves, rather than with a registered serialiser
+_WRAPPER_TYPES = (_Base64Stream, JsonteRaw, JsonteLazyDict, JsonteLazyList, _LazyTagged)
+
+
+# ---- fast paths for parsing the output of isoformat(), with anything else left to dateutil
+
+_ISO_TIMESTAMP_RE = re.compile(u'([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(?:\\.[0-9]{6})?)'
+                               u'([+-][0-9]{2}:[0-9]{2})?\\Z')
+_ISO_TIME_RE = re.compile(u'([0-9]{2}:[0-9]{2}:[0-9]{2}(?:\\.[0-9]{6})?)(?:[+-][0-9]{2}:[0-9]{2})?\\Z')
+
+_tzinfo_cache = dict()  # utc offset text -> tzinfo
+
+
+def _get_tzinfo(offset):
+    try:
+        return _tzinfo_cache[offset]
+    except KeyError:
+        pass
+    hours, minutes = int(offset[1:3]), int(offset[4:6])
+    if hours >= 24 or minutes >= 60:
+        raise ValueError('invalid utc offset %s' % offset)
+    seconds = (hours * 60 + minutes) * 60
+    import dateutil.tz
+    if seconds == 0:
+        tzinfo = dateutil.tz.tzutc()
+    else:
+        tzinfo = dateutil.tz.tzoffset(None, -seconds if offset[0] == u'-' else seconds)
+    _tzinfo_cache[offset] = tzinfo
+    return tzinfo
+
+
+if hasattr(datetime.datetime, 'fromisoformat'):  # Python 3.7+
+    _naive_datetime_from_iso = datetime.datetime.fromisoformat
+    _time_from_iso = datetime.time.fromisoformat
+else:
+    def _naive_datetime_from_iso(text):
+        return datetime.datetime.strptime(text, '%Y-%m-%dT%H:%M:%S.%f' if len(text) > 19 else '%Y-%m-%dT%H:%M:%S')
+
+    def _time_from_iso(text):
+        return datetime.datetime.strptime(text, '%H:%M:%S.%f' if len(text) > 8 else '%H:%M:%S').time()
+
+
+def _parse_iso_timestamp(text):
+    """ Parse the output of datetime.isoformat(), or return None if text is not in that format """
+    match = _ISO_TIMESTAMP_RE.match(text) if isinstance(text, string_types) else None
+    if match is None:
+        return None
+    naive_text, offset = match.groups()
+    try:
+        value = _naive_datetime_from_iso(naive_text)
+        if offset is not None:
+            value = value.replace(tzinfo=_get_tzinfo(offset))
+    except ValueError:
+        return None
+    return value
+
+
+def _parse_iso_time(text):
+    """ Parse the output of time.isoformat() (dropping any utc offset), or return None if not in that format """
+    match = _ISO_TIME_RE.match(text) if isinstance(text, string_types) else None
+    if match is None:
+        return None
+    try:
+        return _time_from_iso(match.group(1))
+    except ValueError:
+        return None
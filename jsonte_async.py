@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+jsonte_async
+----------------------------------
+
+asyncio versions of dump, load and iterload, for asyncio streams such as sockets and HTTP bodies.
+
+The encoding and decoding themselves are still done synchronously, but a piece at a time, with control handed back
+to the event loop between pieces, so other tasks are held up for the encoding or decoding of one chunk rather than
+the whole document.  Requires Python 3.6+.  These are also available as the dump_async, load_async and
+iterload_async methods of JsonteSerialiser, which import this module on first use.
+"""
+
+# standard libs
+import asyncio
+import codecs
+
+# noinspection PyProtectedMember
+from jsonte import _ArrayItemParser
+
+__all__ = ['dump_async', 'load_async', 'iterload_async']
+
+
+async def dump_async(serialiser, obj, writer, chunk_size=65536):
+    """
+    Write obj to writer as utf-8 encoded jsonte, as JsonteSerialiser.dump does.
+    The encoder's output is coalesced into chunks of around chunk_size characters.  After each chunk is written the
+    writer is drained, waiting for the transport's buffer to empty if it is full (backpressure), and control is handed
+    back to the event loop.
+    :param serialiser: JsonteSerialiser
+    :param writer: asyncio.StreamWriter, or anything with write and a drain coroutine
+    """
+    # noinspection PyProtectedMember
+    prefix = serialiser._websafety_prefix_for(obj)
+    # noinspection PyProtectedMember
+    iterable = serialiser._get_encoder().iterencode(obj)
+    pieces = [prefix]
+    size = len(prefix)
+    for piece in iterable:
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            writer.write(u''.join(pieces).encode('utf-8'))
+            pieces = list()
+            size = 0
+            await writer.drain()
+            await asyncio.sleep(0)  # drain only yields while the transport's buffer is full
+    if size:
+        writer.write(u''.join(pieces).encode('utf-8'))
+        await writer.drain()
+
+
+async def _iter_text(reader, chunk_size):
+    """ Yield the text read from reader (text or utf-8 bytes) in chunks, handing control back after each one """
+    text_decoder = None
+    while True:
+        chunk = await reader.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            if text_decoder is None:
+                text_decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = text_decoder.decode(chunk)
+        yield chunk
+        await asyncio.sleep(0)  # read doesn't yield while there is data already buffered
+    if text_decoder is not None:
+        text_decoder.decode(b'', final=True)  # raises for a truncated utf-8 sequence
+
+
+async def load_async(serialiser, reader, chunk_size=65536, parse_float=None, parse_int=None, parse_constant=None):
+    """
+    Read the whole of reader (until EOF) and decode it, as JsonteSerialiser.load does.
+    The document is decoded in one go once read, so use iterload_async to decode large arrays without doing so.
+    :param serialiser: JsonteSerialiser
+    :param reader: asyncio.StreamReader, or anything with a read coroutine
+    """
+    pieces = [chunk async for chunk in _iter_text(reader, chunk_size)]
+    # noinspection PyProtectedMember
+    return serialiser._get_decoder(parse_float, parse_int, parse_constant).decode(u''.join(pieces))
+
+
+async def iterload_async(serialiser, reader, path=None, chunk_size=65536, parse_float=None, parse_int=None,
+                         parse_constant=None):
+    """
+    Decode the items of a json array read from reader one at a time, as JsonteSerialiser.iterload does, so that
+    only around one item is held in memory.  Use as ``async for item in iterload_async(serialiser, reader): ...``
+    :param serialiser: JsonteSerialiser
+    :param reader: asyncio.StreamReader, or anything with a read coroutine
+    :param path: sequence of (un-escaped) object keys leading to the array, by default the top-level array
+    """
+    # noinspection PyProtectedMember
+    decoder = serialiser._get_decoder(parse_float, parse_int, parse_constant)
+    parser = _ArrayItemParser(decoder, path, serialiser.escape_char, serialiser.websafety_prefix)
+    async for chunk in _iter_text(reader, chunk_size):
+        for item in parser.feed(chunk):
+            yield item
+        if parser.done:
+            break
+    for item in parser.close():
+        yield item
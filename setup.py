@@ -16,7 +16,6 @@ with open('HISTORY.rst') as history_file:
 
 requirements = [
     'python-dateutil',
-    'sdag2',
     'six'
 ]
 
@@ -31,7 +30,7 @@ setup(
     author="Rasjid Wilcox",
     author_email='rasjidw@openminddev.net',
     url='https://github.com/rasjidw/python-jsonte',
-    py_modules=['jsonte'],
+    py_modules=['jsonte', 'jsonte_async'],
     install_requires=requirements,
     license="BSD",
     zip_safe=False,
@@ -41,11 +40,11 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 2.6',
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3.3',
         'Programming Language :: Python :: 3.4',
         'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.6',
     ],
     test_suite='test_jsonte',
     tests_require=test_requirements
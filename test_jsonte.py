@@ -8,17 +8,42 @@ test_jsonte
 Tests for `jsonte` module.
 """
 
+import array
 import datetime
 import decimal
+import io
+import itertools
 import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import types
 import unittest
 
+import dateutil.parser
 import dateutil.tz
-from six import StringIO
+import six
+from six import BytesIO, StringIO
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:  # Python 2
+    from collections import Mapping, Sequence
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
 
 import jsonte
 
 
+def _byte_view(source):
+    return memoryview(source).tobytes() if not six.PY2 else bytes(source)
+
+
 class TestJsonte(unittest.TestCase):
     def setUp(self):
         self.serialiser = jsonte.JsonteSerialiser()
@@ -51,6 +76,40 @@ class TestJsonte(unittest.TestCase):
         self.assertEqual(binary, binary2)
         self.assertTrue(isinstance(binary2, bytearray))
 
+    def test_binary_types(self):
+        binary = bytearray(b'Hello World!\x00\x01\x02')
+        jsonte_str = self.serialiser.dumps(binary)
+        sources = [memoryview(binary), memoryview(binary)[::2], array.array('B', binary)]
+        if not six.PY2:
+            sources += [bytes(binary), memoryview(bytes(binary) * 2).cast('H')]
+        for source in sources:
+            self.assertEqual(self.serialiser.loads(self.serialiser.dumps(source)), bytearray(_byte_view(source)))
+        self.assertEqual(self.serialiser.dumps(memoryview(binary)), jsonte_str)
+
+    def test_replace_standard_serialiser(self):
+        def text_serialiser(value):
+            dct = jsonte.SerialisationDict()
+            dct[u'#text'] = bytes(value).decode('latin-1')
+            return dct
+
+        serialiser = jsonte.JsonteSerialiser()
+        serialiser.add_type_serialiser(memoryview, text_serialiser)
+        serialiser.finalise_serialisers()
+        self.assertEqual(serialiser.dumps([memoryview(b'ab'), bytearray(b'ab')]),
+                         u'[{"#text": "ab"}, {"#bin": "YWI="}]')
+        self.assertRaises(ValueError, serialiser.add_type_serialiser, memoryview, text_serialiser)
+
+    def test_binary_decode_types(self):
+        binary = bytearray(b'Hello World!\x00\x01\x02')
+        jsonte_str = self.serialiser.dumps(binary)
+        value = jsonte.JsonteSerialiser(binary_type='bytes').loads(jsonte_str)
+        self.assertTrue(isinstance(value, bytes))
+        self.assertEqual(value, bytes(binary))
+        value = jsonte.JsonteSerialiser(binary_type='memoryview').loads(jsonte_str)
+        self.assertTrue(isinstance(value, memoryview))
+        self.assertEqual(value.tobytes(), bytes(binary))
+        self.assertRaises(ValueError, jsonte.JsonteSerialiser, binary_type='str')
+
     def test_escape_tilde(self):
         data = {u'~foo': u'bar'}
         jsonte_str = self.serialiser.dumps(data)
@@ -67,6 +126,58 @@ class TestJsonte(unittest.TestCase):
         self.assertEqual(data, round_trip)
         self.assertEqual(via_json, {u'~#foo': u'bar'})
 
+    def test_escape_nested(self):
+        data = {u'a': [{u'#num': 1, u'b': {u'~c': 2}}], u'#d': {u'#e': datetime.date(2001, 1, 1)}, u'': 3}
+        jsonte_str = self.serialiser.dumps(data)
+        round_trip = self.serialiser.loads(jsonte_str)
+        via_json = json.loads(jsonte_str)
+        self.assertEqual(data, round_trip)
+        self.assertEqual(via_json, {u'a': [{u'~#num': 1, u'b': {u'~~c': 2}}],
+                                    u'~#d': {u'~#e': {u'#date': u'2001-01-01'}}, u'': 3})
+        fp = StringIO()
+        self.serialiser.dump(data, fp)
+        self.assertEqual(json.loads(fp.getvalue()), via_json)
+
+    def test_escape_look_alikes(self):
+        # strings that look like keys needing escaping in the output, when they are not
+        data = [u'#a', u'#b', {u'c': u'#d', u'e': [u'#f', u'{"#g": 1}', u'\\', u'#h']}, decimal.Decimal('1')]
+        jsonte_str = self.serialiser.dumps(data)
+        self.assertEqual(jsonte_str, json.dumps(data[:-1])[:-1] + u', {"#num": "1"}]')
+        self.assertEqual(self.serialiser.loads(jsonte_str), data)
+
+    def test_escape_nested_sorted(self):
+        serialiser = jsonte.JsonteSerialiser(indent=1, sort_keys=True)
+        data = {u'b': {u'#b': 1, u'a': 2}, u'#a': 3}
+        self.assertEqual(serialiser.dumps(data), json.dumps({u'b': {u'~#b': 1, u'a': 2}, u'~#a': 3},
+                                                            indent=1, sort_keys=True))
+
+    def test_escape_nested_circular(self):
+        data = {u'#a': []}
+        data[u'#a'].append(data)
+        self.assertRaises(ValueError, self.serialiser.dumps, data)
+
+    def test_escape_within_serialiser_output(self):
+        class Foo(object):
+            pass
+
+        # noinspection PyUnusedLocal
+        def foo_serialiser(foo_inst):
+            dct = jsonte.SerialisationDict()
+            dct[u'#foo'] = {u'#x': 1}
+            return dct
+
+        self.serialiser.add_type_serialiser(Foo, foo_serialiser)
+        self.serialiser.finalise_serialisers()
+        via_json = json.loads(self.serialiser.dumps([Foo()]))
+        self.assertEqual(via_json, [{u'#foo': {u'~#x': 1}}])
+
+    def test_unescape_nested(self):
+        jsonte_str = u'[{"a": {"~#num": 1, "b": {"~~c": 2}}}, {"": 3}]'
+        self.assertEqual(self.serialiser.loads(jsonte_str), [{u'a': {u'#num': 1, u'b': {u'~c': 2}}}, {u'': 3}])
+
+    def test_type_name_with_extra_keys(self):
+        self.assertRaises(ValueError, self.serialiser.loads, u'{"#num": "1.0", "other": 1}')
+
     def test_not_escaped(self):
         data = {u'*foo': u'bar'}
         via_json = json.loads(self.serialiser.dumps(data))
@@ -87,6 +198,260 @@ class TestJsonte(unittest.TestCase):
         fp.close()
 
 
+class TestTimestampParsing(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+
+    def check_tstamp(self, text):
+        value = self.serialiser.loads(json.dumps({u'#tstamp': text}))
+        expected = dateutil.parser.parse(text)
+        self.assertEqual(value, expected)
+        self.assertEqual(value.utcoffset(), expected.utcoffset())
+
+    def test_canonical_timestamps(self):
+        for text in (u'2015-05-28T22:13:42', u'2015-05-28T22:13:42.381000', u'2015-05-28T22:13:42.381000+10:00',
+                     u'2015-05-28T22:13:42-05:30', u'2015-05-28T22:13:42+00:00'):
+            self.check_tstamp(text)
+
+    def test_other_timestamps(self):
+        for text in (u'2015-05-28 22:13:42', u'2015-05-28T22:13:42Z', u'2015-05-28T22:13:42.381+10:00',
+                     u'28 May 2015 10:13pm'):
+            self.check_tstamp(text)
+        self.assertRaises(ValueError, self.serialiser.loads, u'{"#tstamp": "2015-13-28T22:13:42"}')
+
+    def test_tzinfo_shared(self):
+        value1, value2 = self.serialiser.loads(u'[{"#tstamp": "2015-05-28T22:13:42+10:00"}, '
+                                               u'{"#tstamp": "2016-05-28T22:13:42+10:00"}]')
+        self.assertTrue(value1.tzinfo is value2.tzinfo)
+
+    def test_times(self):
+        for text in (u'22:12:42', u'22:12:42.381000', u'22:12:42+10:00', u'22:12:42.381', u'10:12pm'):
+            value = self.serialiser.loads(json.dumps({u'#time': text}))
+            self.assertEqual(value, dateutil.parser.parse(text).time())
+
+
+class _GeneratedArrayFile(object):
+    """
+    A read-only file with a json array of item_count copies of item_json, generated as it is read, with item_json
+    replaced by other_items (a dict of index -> json) for some items
+    """
+    def __init__(self, item_json, item_count, other_items=None):
+        self.item_json = item_json
+        self.item_count = item_count
+        self.remaining = item_count
+        self.other_items = other_items or dict()
+        self.pending = u'['
+
+    def read(self, size):
+        while len(self.pending) < size and self.remaining:
+            self.remaining -= 1
+            item_json = self.other_items.get(self.item_count - self.remaining - 1, self.item_json)
+            self.pending += item_json + (u', ' if self.remaining else u']')
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+class TestIterload(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = [{u'now': datetime.datetime(2015, 5, 28, 22, 13, 42), u'#escape': [1.5, None, True]},
+                     decimal.Decimal('10.00'), 1234567, u'caf\xe9 \u2603', [], {}]
+
+    def test_top_level(self):
+        jsonte_str = self.serialiser.dumps(self.data)
+        for chunk_size in (1, 3, 7, 65536):
+            items = list(self.serialiser.iterload(StringIO(jsonte_str), chunk_size=chunk_size))
+            self.assertEqual(items, self.data)
+
+    def test_numbers_split_between_chunks(self):
+        for chunk_size in range(1, 9):
+            items = list(self.serialiser.iterload(StringIO(u'[12.5, -1.5e-07, 3]'), chunk_size=chunk_size))
+            self.assertEqual(items, [12.5, -1.5e-07, 3])
+
+    def test_binary_file(self):
+        jsonte_bytes = self.serialiser.dumps(self.data).encode('utf-8')
+        for chunk_size in (1, 5, 65536):
+            items = list(self.serialiser.iterload(BytesIO(jsonte_bytes), chunk_size=chunk_size))
+            self.assertEqual(items, self.data)
+
+    def test_path(self):
+        doc = {u'meta': {u'rows': [u'not these']}, u'#rows': [0], u'results': {u'rows': self.data}, u'after': 1}
+        jsonte_str = self.serialiser.dumps(doc)
+        items = list(self.serialiser.iterload(StringIO(jsonte_str), path=[u'results', u'rows'], chunk_size=4))
+        self.assertEqual(items, self.data)
+        items = list(self.serialiser.iterload(StringIO(jsonte_str), path=[u'#rows']))
+        self.assertEqual(items, [0])
+
+    def test_websafety_prefix(self):
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        items = list(serialiser.iterload(StringIO(serialiser.dumps(self.data)), chunk_size=2))
+        self.assertEqual(items, self.data)
+
+    def test_errors(self):
+        jsonte_str = self.serialiser.dumps({u'rows': self.data})
+        self.assertRaises(ValueError, list, self.serialiser.iterload(StringIO(jsonte_str)))
+        self.assertRaises(ValueError, list, self.serialiser.iterload(StringIO(jsonte_str), path=[u'other']))
+        self.assertRaises(ValueError, list, self.serialiser.iterload(StringIO(jsonte_str[:-10]), path=[u'rows']))
+        self.assertRaises(ValueError, list, self.serialiser.iterload(StringIO(u'[1, 2 3]')))
+
+    @unittest.skipUnless(tracemalloc, 'needs tracemalloc')
+    def test_bounded_memory(self):
+        item_json = self.serialiser.dumps({u'id': 1, u'when': datetime.datetime(2015, 5, 28, 22, 13, 42),
+                                           u'cost': decimal.Decimal('12.50'), u'name': u'x' * 200})
+        size_mb = int(os.environ.get('JSONTE_TEST_STREAM_MB', '10'))
+        item_count = size_mb * 1024 * 1024 // (len(item_json) + 2)
+        tracemalloc.start()
+        try:
+            count = 0
+            for item in self.serialiser.iterload(_GeneratedArrayFile(item_json, item_count)):
+                count += 1
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(count, item_count)
+        self.assertTrue(peak < 1024 * 1024, 'peak memory was %d bytes' % peak)
+
+    def test_invalid_item_raised_at_once(self):
+        item_json = self.serialiser.dumps({u'id': 1, u'when': datetime.datetime(2015, 5, 28, 22, 13, 42),
+                                           u'name': u'x' * 200})
+        item_count = 10 * 1024 * 1024 // (len(item_json) + 2)
+        for bad_item_json in (u'{"id": 1,, "name": "x"}', u'{"when": {"#date": "not a date"}}', u'[1, 2 3]'):
+            fp = _GeneratedArrayFile(item_json, item_count, {5: bad_item_json})
+            self.assertRaises(ValueError, list, self.serialiser.iterload(fp))
+            # rather than reading (and holding) the rest of the stream first
+            self.assertTrue(fp.remaining > item_count - 1000, 'read %d items' % (item_count - fp.remaining))
+
+
+class TestLines(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = [{u'now': datetime.datetime(2015, 5, 28, 22, 13, 42), u'#escape': u'two\nlines'},
+                     decimal.Decimal('10.00'), [1, 2], u'caf\xe9']
+
+    def test_round_trip(self):
+        for buffer_size in (1, 65536):
+            fp = StringIO()
+            self.serialiser.dump_lines(iter(self.data), fp, buffer_size=buffer_size)
+            self.assertEqual(len(fp.getvalue().splitlines()), len(self.data))
+            self.assertTrue(fp.getvalue().endswith(u'\n'))
+            fp.seek(0)
+            self.assertEqual(list(self.serialiser.load_lines(fp)), self.data)
+
+    def test_load_binary(self):
+        lines = u'{"#num": "1.5"}\r\n\n  [\"caf\xe9\"]  \n'.encode('utf-8')
+        self.assertEqual(list(self.serialiser.load_lines(BytesIO(lines))), [decimal.Decimal('1.5'), [u'caf\xe9']])
+
+    def test_indent_rejected(self):
+        serialiser = jsonte.JsonteSerialiser(indent=2)
+        self.assertRaises(ValueError, serialiser.dump_lines, self.data, StringIO())
+        serialiser = jsonte.JsonteSerialiser(separators=(u',\n', u':'))
+        self.assertRaises(ValueError, serialiser.dump_lines, self.data, StringIO())
+
+    def test_websafety(self):
+        serialiser = jsonte.JsonteSerialiser(array_websafety='exception')
+        self.assertRaises(RuntimeError, serialiser.dump_lines, self.data, StringIO())
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        fp = StringIO()
+        serialiser.dump_lines(self.data, fp)
+        self.assertEqual(fp.getvalue().splitlines()[0], u")]}',")
+        fp.seek(0)
+        self.assertEqual(list(serialiser.load_lines(fp)), self.data)
+
+
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = [{u'now': datetime.datetime(2015, 5, 28, 22, 13, i), u'#escape': i} for i in range(50)]
+
+    def test_round_trip(self):
+        strings = self.serialiser.dumps_many(self.data, workers=2, chunksize=7)
+        self.assertEqual(strings, [self.serialiser.dumps(obj) for obj in self.data])
+        self.assertEqual(self.serialiser.loads_many(strings, workers=2, chunksize=7), self.data)
+
+    def test_in_process(self):
+        strings = self.serialiser.dumps_many(self.data, workers=1)
+        self.assertEqual(self.serialiser.loads_many(strings, workers=1), self.data)
+
+    def test_not_importable(self):
+        self.serialiser.add_type_serialiser(complex, lambda num: jsonte.decimal_serialiser(num.real))
+        self.serialiser.finalise_serialisers()
+        self.assertRaises(ValueError, self.serialiser.dumps_many, self.data, workers=2)
+
+
+class _ZerosFile(io.RawIOBase):
+    """ A read-only binary file of size zero bytes, generated as it is read """
+    def __init__(self, size):
+        io.RawIOBase.__init__(self)
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        count = min(len(buf), self.remaining, 10000)  # short reads, as raw files may do
+        buf[:count] = b'\x00' * count
+        self.remaining -= count
+        return count
+
+
+class TestBinaryStreaming(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.binary = bytearray(range(256)) * 1000
+
+    def test_dump_in_chunks(self):
+        class Writer(object):
+            def __init__(self):
+                self.chunks = list()
+
+            def write(self, chunk):
+                self.chunks.append(chunk)
+
+        writer = Writer()
+        self.serialiser.dump({u'#data': memoryview(self.binary)}, writer)
+        self.assertTrue(len(writer.chunks) > 2)
+        self.assertTrue(max(len(chunk) for chunk in writer.chunks) <= 65536)
+        self.assertEqual(u''.join(writer.chunks), self.serialiser.dumps({u'#data': self.binary}))
+
+    def test_file_source(self):
+        self.serialiser.add_type_serialiser(_ZerosFile, jsonte.binary_serialiser)
+        self.serialiser.finalise_serialisers()
+        expected = self.serialiser.dumps([bytearray(100001)])
+        self.assertEqual(self.serialiser.dumps([_ZerosFile(100001)]), expected)
+        fp = StringIO()
+        self.serialiser.dump([_ZerosFile(100001)], fp)
+        self.assertEqual(fp.getvalue(), expected)
+
+    def test_iterator_source(self):
+        def pieces():
+            for i in range(0, len(self.binary), 1001):
+                yield self.binary[i:i + 1001]
+
+        self.serialiser.add_type_serialiser(types.GeneratorType, jsonte.binary_serialiser)
+        self.serialiser.finalise_serialisers()
+        self.assertEqual(self.serialiser.dumps(pieces()), self.serialiser.dumps(self.binary))
+        fp = StringIO()
+        self.serialiser.dump({u'#a': pieces()}, fp)  # the key needs escaping, so dumps can't use the C encoder
+        self.assertEqual(self.serialiser.loads(fp.getvalue()), {u'#a': self.binary})
+
+    @unittest.skipUnless(tracemalloc, 'needs tracemalloc')
+    def test_bounded_memory(self):
+        class NullWriter(object):
+            def write(self, chunk):
+                pass
+
+        self.serialiser.add_type_serialiser(_ZerosFile, jsonte.binary_serialiser)
+        self.serialiser.finalise_serialisers()
+        size_mb = int(os.environ.get('JSONTE_TEST_BLOB_MB', '500'))
+        tracemalloc.start()
+        try:
+            self.serialiser.dump({u'attachment': _ZerosFile(size_mb * 1024 * 1024)}, NullWriter())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(peak < 1024 * 1024, 'peak memory was %d bytes' % peak)
+
+
 class TestCustomEscape(unittest.TestCase):
     def setUp(self):
         self.serialiser = jsonte.JsonteSerialiser()
@@ -183,6 +548,14 @@ class TestCustomObjectHook(unittest.TestCase):
         self.assertEqual(bar.value, decimal.Decimal('42.00'))
 
 
+def _object_serialiser():
+    """ A JsonteSerialiser with a serialiser registered for object, which catches every otherwise unknown class """
+    serialiser = jsonte.JsonteSerialiser()
+    serialiser.add_type_serialiser(object, lambda obj: jsonte.SerialisationDict({u'#obj': u'A obj instance'}))
+    serialiser.finalise_serialisers()
+    return serialiser
+
+
 class TestOrderIndependance(unittest.TestCase):
     def test_order_independance(self):
         class Foo(object):
@@ -209,6 +582,731 @@ class TestOrderIndependance(unittest.TestCase):
         jsonte_str = serialiser.dumps(f)
         self.assertTrue(u'A foo instance' in jsonte_str)
 
+    def test_object_serialiser_with_binary(self):
+        serialiser = _object_serialiser()
+        for binary in (bytearray(b'hi'), memoryview(b'hi'), array.array('B', b'hi')):
+            fp = StringIO()
+            serialiser.dump(binary, fp)
+            self.assertEqual(fp.getvalue(), serialiser.dumps(binary))
+        self.assertEqual(serialiser.dumps(bytearray(b'hi')), u'{"#bin": "aGk="}')
+        self.assertEqual(serialiser.loads(serialiser.dumps(bytearray(b'hi'))), bytearray(b'hi'))
+
+    def test_object_serialiser_with_raw(self):
+        serialiser = _object_serialiser()
+        data = {u'a': jsonte.JsonteRaw(u'[1, {"#date": "2001-01-01"}]')}
+        fp = StringIO()
+        serialiser.dump(data, fp)
+        self.assertEqual(serialiser.dumps(data), u'{"a": [1, {"#date": "2001-01-01"}]}')
+        self.assertEqual(fp.getvalue(), serialiser.dumps(data))
+
+    def test_any_order(self):
+        class A(object):
+            pass
+
+        class B(A):
+            pass
+
+        class C(B):
+            pass
+
+        def make_serialiser(name):
+            return lambda obj: jsonte.SerialisationDict({u'#' + name: u''})
+
+        for classes in itertools.permutations([A, B, C, object]):
+            serialiser = jsonte.JsonteSerialiser()
+            for cls in classes:
+                serialiser.add_type_serialiser(cls, make_serialiser(cls.__name__))
+            serialiser.finalise_serialisers()
+            self.assertEqual([serialiser.dumps(cls()) for cls in (C, B, A, object)],
+                             [u'{"#C": ""}', u'{"#B": ""}', u'{"#A": ""}', u'{"#object": ""}'])
+            # the standard types still take precedence over object
+            self.assertEqual(serialiser.dumps(decimal.Decimal(1)), u'{"#num": "1"}')
+        # the standard types are shared, but not changed by adding to them
+        self.assertFalse(A in jsonte.JsonteSerialiser().get_type_classes())
+
+
+class TestTypeDispatch(unittest.TestCase):
+    def test_subclass_uses_nearest_serialiser(self):
+        class MyDate(datetime.date):
+            pass
+
+        serialiser = jsonte.JsonteSerialiser()
+        jsonte_str = serialiser.dumps([MyDate(2001, 1, 1), datetime.datetime(2001, 1, 1, 12, 30)])
+        via_json = json.loads(jsonte_str)
+        self.assertEqual(via_json, [{u'#date': u'2001-01-01'}, {u'#tstamp': u'2001-01-01T12:30:00'}])
+
+    def test_dispatch_cache_invalidated(self):
+        class Foo(object):
+            pass
+
+        # noinspection PyUnusedLocal
+        def foo_serialiser(foo_inst):
+            dct = jsonte.SerialisationDict()
+            dct[u'#foo'] = u'A foo instance'
+            return dct
+
+        serialiser = jsonte.JsonteSerialiser()
+        self.assertRaises(TypeError, serialiser.dumps, Foo())
+        serialiser.add_type_serialiser(Foo, foo_serialiser)
+        serialiser.finalise_serialisers()
+        self.assertTrue(u'A foo instance' in serialiser.dumps(Foo()))
+
+    @unittest.skipUnless(six.PY2, 'old style classes are Python 2 only')
+    def test_old_style_classes(self):
+        class Foo:
+            pass
+
+        class Bar:
+            pass
+
+        serialiser = jsonte.JsonteSerialiser()
+        serialiser.add_type_serialiser(Foo, lambda obj: jsonte.SerialisationDict({u'#foo': u''}))
+        serialiser.add_type_serialiser(Bar, lambda obj: jsonte.SerialisationDict({u'#bar': u''}))
+        serialiser.finalise_serialisers()
+        self.assertEqual(serialiser.dumps([Foo(), Bar()]), u'[{"#foo": ""}, {"#bar": ""}]')
+
+
+class TestEncoderCache(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+
+    def test_encoder_reused(self):
+        # noinspection PyProtectedMember
+        encoder = self.serialiser._get_encoder()
+        self.serialiser.dumps({u'a': 1})
+        # noinspection PyProtectedMember
+        self.assertTrue(self.serialiser._get_encoder() is encoder)
+
+    def test_option_change(self):
+        data = {u'a': [1, 2]}
+        self.assertEqual(self.serialiser.dumps(data), u'{"a": [1, 2]}')
+        self.serialiser.separators = (u',', u':')
+        self.assertEqual(self.serialiser.dumps(data), u'{"a":[1,2]}')
+        self.serialiser.indent = 2
+        self.assertEqual(self.serialiser.dumps(data), u'{\n  "a":[\n    1,\n    2\n  ]\n}')
+
+    def test_not_finalised(self):
+        class Foo(object):
+            pass
+
+        self.serialiser.dumps({u'a': 1})
+        self.serialiser.add_type_serialiser(Foo, jsonte.decimal_serialiser)
+        self.assertRaises(RuntimeError, self.serialiser.dumps, {u'a': 1})
+        self.serialiser.finalise_serialisers()
+        self.assertEqual(self.serialiser.dumps({u'a': 1}), u'{"a": 1}')
+
+    def test_other_thread_not_finalised(self):
+        class Foo(object):
+            pass
+
+        self.serialiser.add_type_serialiser(Foo, jsonte.decimal_serialiser)
+        results = list()
+        thread = threading.Thread(target=lambda: results.append(self.serialiser.dumps({u'a': 1})))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [u'{"a": 1}'])
+        self.assertTrue(Foo in self.serialiser.get_type_classes())
+
+    def test_pickled_not_finalised(self):
+        self.serialiser.add_type_serialiser(_Point, _point_serialiser)
+        # a copy from this thread isn't finalised for any thread, as sent to worker processes by dumps_many
+        serialiser2 = pickle.loads(pickle.dumps(self.serialiser))
+        self.assertRaises(RuntimeError, serialiser2.dumps, {u'a': 1})
+        serialiser2.finalise_serialisers()
+        self.assertEqual(serialiser2.dumps(_Point(1, 2)), u'{"#point": [1, {"~#y": 2}]}')
+        # while other threads use the types as they were
+        results = list()
+        thread = threading.Thread(target=lambda: results.append(pickle.loads(pickle.dumps(self.serialiser))))
+        thread.start()
+        thread.join()
+        self.assertEqual(results[0].dumps({u'a': 1}), u'{"a": 1}')
+        self.assertFalse(_Point in results[0].get_type_classes())
+
+
+class TestThreads(unittest.TestCase):
+    def test_register_while_in_use(self):
+        serialiser = jsonte.JsonteSerialiser()
+        data = [{u'#id': i, u'cost': decimal.Decimal(i), u'day': datetime.date(2001, 1, 1 + i % 28)} for i in range(50)]
+        expected = serialiser.dumps(data)
+        stop = threading.Event()
+        errors = list()
+        counts = list()
+
+        def use():
+            count = 0
+            try:
+                while not stop.is_set():
+                    self.assertEqual(serialiser.dumps(data), expected)
+                    self.assertEqual(serialiser.loads(expected), data)
+                    count += 1
+            except Exception as e:
+                errors.append(e)
+            counts.append(count)
+
+        def register():
+            try:
+                for i in range(100):
+                    cls = type('Type%d' % i, (object,), {})
+                    serialiser.add_type_serialiser(cls, lambda obj, i=i: jsonte.SerialisationDict({u'#t%d' % i: i}))
+                    serialiser.finalise_serialisers()
+                    serialiser.add_type_deserialiser(u'#t%d' % i, lambda dct, cls=cls: cls())
+                    self.assertTrue(isinstance(serialiser.loads(serialiser.dumps([cls()]))[0], cls))
+                    if i % 10 == 0:
+                        serialiser.enable_stats()
+                        serialiser.disable_stats()
+            except Exception as e:
+                errors.append(e)
+
+        users = [threading.Thread(target=use) for i in range(4)]
+        registerer = threading.Thread(target=register)
+        for thread in users:
+            thread.start()
+        registerer.start()
+        registerer.join()
+        stop.set()
+        for thread in users:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(counts), 4)
+        self.assertEqual(len(serialiser.get_type_classes()), len(jsonte._STANDARD_SERIALISERS) + 100)
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = [{u'#a': decimal.Decimal('1.5'), u'b': datetime.date(2001, 1, 1)}, {u'~c': decimal.Decimal('2')}]
+
+    def test_counts(self):
+        self.serialiser.enable_stats()
+        fp = StringIO()
+        self.serialiser.dump(self.data, fp)
+        self.assertEqual(self.serialiser.loads(fp.getvalue()), self.data)
+        stats = self.serialiser.stats()
+        self.assertEqual(dict((name, counts['calls']) for name, counts in stats['serialisers'].items()),
+                         {u'decimal.Decimal': 2, u'datetime.date': 1})
+        self.assertEqual(dict((name, counts['calls']) for name, counts in stats['deserialisers'].items()),
+                         {u'#num': 2, u'#date': 1})
+        self.assertTrue(all(counts['time'] >= 0 for counts in stats['deserialisers'].values()))
+        self.assertEqual(stats['objects'], 5)
+        self.assertEqual(stats['escaped_keys'], 2)
+        self.assertEqual(stats['unescaped_keys'], 2)
+        self.serialiser.reset_stats()
+        self.assertEqual(self.serialiser.stats(), dict(serialisers={}, deserialisers={}, objects=0, unescaped_keys=0,
+                                                       escaped_keys=0))
+
+    def test_dumps_counts(self):
+        # dumps falls back to other encoders for nested keys needing escaping, and for JsonteRaw, without counting
+        # the serialiser calls or escaped keys from before falling back
+        for engine in ('json', 'preconvert'):
+            serialiser = jsonte.JsonteSerialiser(engine=engine)
+            serialiser.enable_stats()
+            for data in (self.data, self.data + [jsonte.JsonteRaw(u'1')]):
+                serialiser.reset_stats()
+                serialiser.dumps(data)
+                stats = serialiser.stats()
+                self.assertEqual(dict((name, counts['calls']) for name, counts in stats['serialisers'].items()),
+                                 {u'decimal.Decimal': 2, u'datetime.date': 1})
+                self.assertEqual(stats['escaped_keys'], 2)
+
+    def test_sampling(self):
+        self.serialiser.enable_stats(sample_every=10)
+        for i in range(25):
+            self.serialiser.loads(self.serialiser.dumps(decimal.Decimal(i)))
+        stats = self.serialiser.stats()
+        self.assertEqual(stats['serialisers'][u'decimal.Decimal']['calls'], 25)
+        self.assertEqual(stats['deserialisers'][u'#num']['calls'], 25)
+        self.assertRaises(ValueError, self.serialiser.enable_stats, sample_every=0)
+
+    def test_types_registered_later(self):
+        class MyDate(datetime.date):
+            pass
+
+        self.serialiser.enable_stats()
+        self.serialiser.add_type_serialiser(_Point, _point_serialiser)
+        self.serialiser.add_type_deserialiser(u'#point', lambda dct: _Point(*dct[u'#point']))
+        self.serialiser.finalise_serialisers()
+        fp = StringIO()
+        self.serialiser.dump([_Point(1, 2), MyDate(2001, 1, 1)], fp)
+        self.serialiser.loads(fp.getvalue())
+        stats = self.serialiser.stats()
+        self.assertEqual(stats['serialisers'][u'test_jsonte._Point']['calls'], 1)
+        self.assertEqual(stats['serialisers'][u'datetime.date']['calls'], 1)
+        self.assertEqual(stats['deserialisers'][u'#point']['calls'], 1)
+
+    def test_disabled(self):
+        self.assertRaises(RuntimeError, self.serialiser.stats)
+        self.serialiser.enable_stats()
+        self.serialiser.disable_stats()
+        self.assertRaises(RuntimeError, self.serialiser.stats)
+        # noinspection PyProtectedMember
+        self.assertTrue(self.serialiser._registry.deserialiser_dispatch is self.serialiser._registry.deserialisers)
+        self.assertEqual(self.serialiser.loads(self.serialiser.dumps(self.data)), self.data)
+
+
+class TestDeserialiserCache(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = [{u'day': datetime.date(2001, 1, 1 + i % 3), u'cost': decimal.Decimal('1.50')} for i in range(9)]
+
+    def test_cached_values(self):
+        self.serialiser.enable_cache()
+        data2 = self.serialiser.loads(self.serialiser.dumps(self.data))
+        self.assertEqual(data2, self.data)
+        self.assertTrue(data2[0][u'day'] is data2[3][u'day'])
+        info = self.serialiser.cache_info()
+        self.assertEqual(info[u'#date'], dict(hits=6, misses=3, evictions=0, size=3, maxsize=4096, hit_rate=6 / 9.0))
+        self.assertEqual((info[u'#num'][u'hits'], info[u'#num'][u'misses']), (8, 1))
+        self.assertEqual(info[u'#time'][u'hits'] + info[u'#time'][u'misses'], 0)
+        self.serialiser.disable_cache()
+        self.assertEqual(self.serialiser.cache_info(), {})
+        data2 = self.serialiser.loads(self.serialiser.dumps(self.data))
+        self.assertFalse(data2[0][u'day'] is data2[3][u'day'])
+
+    def test_eviction(self):
+        self.serialiser.enable_cache([u'#date'], maxsize=2)
+        self.assertEqual(self.serialiser.loads(self.serialiser.dumps(self.data)), self.data)
+        info = self.serialiser.cache_info()
+        self.assertEqual(list(info), [u'#date'])
+        self.assertEqual((info[u'#date'][u'misses'], info[u'#date'][u'evictions'], info[u'#date'][u'size']), (9, 7, 2))
+        # the least recently used value is dropped first
+        self.serialiser.enable_cache([u'#date'], maxsize=2)
+        self.serialiser.loads(u'[{"#date": "2001-01-01"}, {"#date": "2001-01-02"}, {"#date": "2001-01-01"}, '
+                              u'{"#date": "2001-01-03"}, {"#date": "2001-01-01"}]')
+        self.assertEqual(self.serialiser.cache_info()[u'#date'][u'hits'], 2)
+
+    def test_errors_and_extra_keys(self):
+        self.serialiser.enable_cache()
+        self.assertRaises(ValueError, self.serialiser.loads, u'{"#date": "2001-01-01", "x": 1}')
+        self.assertRaises(ValueError, self.serialiser.enable_cache, [u'#nosuchtype'])
+        self.assertRaises(ValueError, self.serialiser.enable_cache, maxsize=0)
+
+    def test_with_stats_and_pickle(self):
+        self.serialiser.enable_cache([u'#date'])
+        self.serialiser.enable_stats()
+        text = self.serialiser.dumps(self.data)
+        self.serialiser.loads(text)
+        self.assertEqual(self.serialiser.stats()['deserialisers'][u'#date']['calls'], 9)
+        self.assertEqual(self.serialiser.cache_info()[u'#date'][u'hits'], 6)
+        serialiser2 = pickle.loads(pickle.dumps(self.serialiser))
+        self.assertEqual(serialiser2.cache_info()[u'#date'][u'size'], 0)
+        self.assertEqual(serialiser2.loads(text), self.data)
+        self.assertEqual(serialiser2.cache_info()[u'#date'][u'hits'], 6)
+
+
+class TestLazy(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = {u'#id': 1, u'costs': [decimal.Decimal('1.50'), [datetime.date(2001, 1, 1)]],
+                     u'owner': {u'~name': u'fred', u'data': bytearray(b'\x00\x01')}}
+        self.jsonte_str = self.serialiser.dumps(self.data)
+
+    def test_catch_all_serialisers(self):
+        # lazy results are written out as they were read, even with serialisers for object or the abstract base classes
+        for classes in ((object,), (Mapping, Sequence)):
+            serialiser = jsonte.JsonteSerialiser()
+            for cls in classes:
+                serialiser.add_type_serialiser(cls, lambda obj: jsonte.SerialisationDict({u'#obj': u''}))
+            serialiser.finalise_serialisers()
+            lazy = serialiser.loads(self.jsonte_str, lazy=True)
+            lazy[u'costs'][0]  # converted
+            fp = StringIO()
+            serialiser.dump(lazy, fp)
+            self.assertEqual(json.loads(fp.getvalue()), json.loads(self.jsonte_str))
+            self.assertEqual(json.loads(serialiser.dumps(lazy)), json.loads(self.jsonte_str))
+
+    def test_equal_to_eager(self):
+        lazy = self.serialiser.loads(self.jsonte_str, lazy=True)
+        self.assertTrue(isinstance(lazy, jsonte.JsonteLazyDict))
+        self.assertTrue(isinstance(lazy[u'costs'], jsonte.JsonteLazyList))
+        self.assertEqual(lazy, self.data)
+        self.assertEqual(lazy[u'costs'][1:], [[datetime.date(2001, 1, 1)]])
+        self.assertEqual(sorted(lazy), sorted(self.data))
+        self.assertEqual(self.serialiser.load(StringIO(self.jsonte_str), lazy=True), self.data)
+        self.assertEqual(self.serialiser.loads(u'[{"#num": "2"}]', lazy=True), [decimal.Decimal('2')])
+        self.assertEqual(self.serialiser.loads(u'{"#num": "2"}', lazy=True), decimal.Decimal('2'))
+
+    def test_converted_on_access(self):
+        self.serialiser.enable_stats()
+        lazy = self.serialiser.loads(self.jsonte_str, lazy=True)
+        self.assertEqual(lazy[u'owner'][u'~name'], u'fred')
+        self.assertEqual(self.serialiser.stats()['deserialisers'], {})
+        costs = lazy[u'costs']
+        self.assertTrue(costs[0] is costs[0])
+        self.assertEqual(self.serialiser.stats()['deserialisers'][u'#num']['calls'], 1)
+        self.assertEqual(len(self.serialiser.stats()['deserialisers']), 1)
+        # errors are raised when the value is accessed, rather than by loads
+        lazy = self.serialiser.loads(u'{"a": {"#date": "not a date"}, "b": 1}', lazy=True)
+        self.assertEqual(lazy[u'b'], 1)
+        self.assertRaises(ValueError, lambda: lazy[u'a'])
+
+    def test_raw_and_reencoding(self):
+        jsonte_str = u'{"when": {"#tstamp": "28 May 2015 22:13"}, "~#a": [{"#num": "1.50"}]}'
+        lazy = self.serialiser.loads(jsonte_str, lazy=True)
+        self.assertEqual(lazy[u'#a'][0], decimal.Decimal('1.50'))
+        self.assertEqual(lazy.raw(), json.loads(jsonte_str))
+        self.assertEqual(lazy[u'#a'].raw(), [{u'#num': u'1.50'}])
+        # the unconverted timestamp is written out as it was read
+        self.assertEqual(json.loads(self.serialiser.dumps(lazy)), json.loads(jsonte_str))
+        self.assertEqual(lazy[u'when'], datetime.datetime(2015, 5, 28, 22, 13))
+        self.assertEqual(json.loads(self.serialiser.dumps(lazy))[u'when'], {u'#tstamp': u'2015-05-28T22:13:00'})
+        for engine in (u'json', u'preconvert'):
+            serialiser = jsonte.JsonteSerialiser(engine=engine)
+            lazy = serialiser.loads(self.jsonte_str, lazy=True)
+            self.assertEqual(serialiser.loads(serialiser.dumps(lazy)), self.data)
+            fp = StringIO()
+            serialiser.dump(lazy, fp)
+            self.assertEqual(serialiser.loads(fp.getvalue()), self.data)
+
+    def test_changes(self):
+        lazy = self.serialiser.loads(self.jsonte_str, lazy=True)
+        lazy[u'costs'].append(decimal.Decimal('3'))
+        del lazy[u'costs'][1]
+        lazy[u'owner'][u'#new'] = datetime.date(2002, 2, 2)
+        del lazy[u'#id']
+        self.assertEqual(self.serialiser.loads(self.serialiser.dumps(lazy)),
+                         {u'costs': [decimal.Decimal('1.50'), decimal.Decimal('3')],
+                          u'owner': {u'~name': u'fred', u'data': bytearray(b'\x00\x01'),
+                                     u'#new': datetime.date(2002, 2, 2)}})
+
+
+class TestRaw(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.payload = {u'when': datetime.datetime(2015, 5, 28, 22, 13), u'#data': bytearray(b'\x00\x01')}
+        self.jsonte_str = self.serialiser.dumps({u'route': u'a', u'payload': self.payload,
+                                                 u'~meta': {u'cost': decimal.Decimal('1.50'), u'#tags': [u'x']}})
+
+    def test_dumps_raw(self):
+        raw = jsonte.JsonteRaw(u'{"#date": "2001-01-01", "ignored": [1,2]}')
+        for engine in (u'json', u'preconvert'):
+            serialiser = jsonte.JsonteSerialiser(engine=engine)
+            jsonte_str = serialiser.dumps({u'#a': [raw, 1]})
+            self.assertEqual(jsonte_str, u'{"~#a": [{"#date": "2001-01-01", "ignored": [1,2]}, 1]}')
+            fp = StringIO()
+            serialiser.dump([raw], fp)
+            self.assertEqual(fp.getvalue(), u'[' + raw.text + u']')
+        self.assertEqual(raw, jsonte.JsonteRaw(raw.text))
+
+    def test_loads_raw_paths(self):
+        data = self.serialiser.loads(self.jsonte_str, raw_paths=[[u'payload'], [u'~meta', u'#tags']])
+        self.assertEqual(data[u'payload'], jsonte.JsonteRaw(self.serialiser.dumps(self.payload)))
+        self.assertEqual(data[u'~meta'], {u'cost': decimal.Decimal('1.50'), u'#tags': jsonte.JsonteRaw(u'["x"]')})
+        self.assertEqual(self.serialiser.loads(data[u'payload'].text), self.payload)
+        # patch and forward
+        data[u'route'] = u'b'
+        forwarded = self.serialiser.loads(self.serialiser.dumps(data))
+        self.assertEqual(forwarded, {u'route': u'b', u'payload': self.payload,
+                                     u'~meta': {u'cost': decimal.Decimal('1.50'), u'#tags': [u'x']}})
+        lazy = self.serialiser.loads(self.jsonte_str.encode('utf-8'), lazy=True, raw_paths=[[u'payload']])
+        self.assertTrue(isinstance(lazy, jsonte.JsonteLazyDict))
+        self.assertTrue(isinstance(lazy[u'payload'], jsonte.JsonteRaw))
+        # paths that aren't there, or lead through something other than an object, are ignored
+        self.assertEqual(self.serialiser.loads(u' [{"a": 1}] ', raw_paths=[[u'a']]), [{u'a': 1}])
+        self.assertEqual(self.serialiser.loads(u'{"a": 1}', raw_paths=[[u'a', u'b'], [u'c']]), {u'a': 1})
+
+    def test_loads_raw_paths_errors(self):
+        for jsonte_str in (u'{"a": 1,}', u'{"a" 1}', u'{"a": 1} x', u'{1: 2}', u'{"a": [1}'):
+            self.assertRaises(ValueError, self.serialiser.loads, jsonte_str, raw_paths=[[u'a']])
+        self.assertRaises(ValueError, self.serialiser.loads, u'{}', raw_paths=[[]])
+
+
+class TestJsonteFile(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.rows = [{u'id': i, u'#day': datetime.date(2001, 1, 1 + i % 28), u'cost': decimal.Decimal(i),
+                      u'note': u'caf\xe9 ]"[ %d' % i, u'data': bytearray(b'x' * i)} for i in range(50)]
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with io.open(path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+        return path
+
+    def test_array(self):
+        path = self.write(u'rows.json', self.serialiser.dumps(self.rows))
+        # a small chunk_size, so that items are cut off by the end of the pieces scanned
+        with jsonte.JsonteFile(path, self.serialiser, chunk_size=16) as jsonte_file:
+            self.assertFalse(jsonte_file.lines)
+            self.assertEqual(len(jsonte_file), len(self.rows))
+            self.assertEqual(jsonte_file[3], self.rows[3])
+            self.assertEqual(jsonte_file[-1], self.rows[-1])
+            self.assertEqual(jsonte_file[10:20:3], self.rows[10:20:3])
+            self.assertEqual(list(jsonte_file), self.rows)
+            self.assertEqual(json.loads(jsonte_file.raw(0)), json.loads(self.serialiser.dumps(self.rows[0])))
+            self.assertRaises(IndexError, lambda: jsonte_file[50])
+        for text, length in ((u' [ ] ', 0), (u")]}',\n[1, 2.5, -3]", 3), (u'[[1, [2]], {"a": "]"}]', 2)):
+            with jsonte.JsonteFile(self.write(u'other.json', text)) as jsonte_file:
+                self.assertEqual(list(jsonte_file), json.loads(text.replace(u")]}',", u''))[:length])
+        for text in (u'[1, 2', u'[1, 2,]', u'[1 2]', u'[1] x', u'[{"a": }]'):
+            self.assertRaises(ValueError, jsonte.JsonteFile, self.write(u'bad.json', text), lines=False)
+        path = self.write(u'numbers.json', u'[12.5, -1.5e-07, 3]')
+        for chunk_size in range(1, 9):  # with numbers cut off by the end of the pieces scanned
+            with jsonte.JsonteFile(path, chunk_size=chunk_size) as jsonte_file:
+                self.assertEqual(list(jsonte_file), [12.5, -1.5e-07, 3])
+
+    def test_lines(self):
+        fp = StringIO()
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        serialiser.dump_lines(self.rows, fp)
+        path = self.write(u'rows.txt', fp.getvalue() + u'\n  \n')
+        with jsonte.JsonteFile(path, serialiser) as jsonte_file:
+            self.assertTrue(jsonte_file.lines)
+            self.assertEqual(len(jsonte_file), len(self.rows))
+            self.assertEqual(jsonte_file[-2], self.rows[-2])
+            self.assertEqual(list(jsonte_file), self.rows)
+        with jsonte.JsonteFile(self.write(u'empty.jsonl', u'')) as jsonte_file:
+            self.assertEqual(len(jsonte_file), 0)
+
+    def test_saved_index(self):
+        path = self.write(u'rows.jsonl', u'\n'.join(self.serialiser.dumps(row) for row in self.rows))
+        index_path = path + u'.index'
+        with jsonte.JsonteFile(path, index_path=index_path) as jsonte_file:
+            self.assertEqual(jsonte_file[5], self.rows[5])
+        self.assertTrue(os.path.exists(index_path))
+        with jsonte.JsonteFile(path, index_path=index_path) as jsonte_file:
+            self.assertEqual(list(jsonte_file), self.rows)
+        # an out of date index is rebuilt
+        path = self.write(u'rows.jsonl', u'\n'.join(self.serialiser.dumps(row) for row in self.rows[:10]))
+        with jsonte.JsonteFile(path, index_path=index_path) as jsonte_file:
+            self.assertEqual(list(jsonte_file), self.rows[:10])
+        with open(index_path, 'wb') as fp:
+            fp.write(b'damaged')
+        with jsonte.JsonteFile(path, index_path=index_path) as jsonte_file:
+            self.assertEqual(len(jsonte_file), 10)
+
+
+class TestCompile(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.rows = [{u'id': i, u'name': u'row %d \u00e9' % i, u'#score': i / 3.0, u'active': i % 2 == 0,
+                      u'price': decimal.Decimal(i).scaleb(-2), u'day': datetime.date(2001, 1, 1 + i),
+                      u'when': datetime.datetime(2001, 1, 1, i), u'blob': bytearray(b'x' * i), u'~note': None,
+                      u'extra': {u'#a': [i]}} for i in range(10)]
+        self.schema = [(u'id', int), (u'name', six.text_type), (u'#score', float), (u'active', bool),
+                       (u'price', decimal.Decimal), (u'day', datetime.date), (u'when', datetime.datetime),
+                       (u'blob', bytearray), (u'~note', type(None)), (u'extra', None)]
+
+    def test_same_as_dumps(self):
+        for options in (dict(), dict(sort_keys=True), dict(ensure_ascii=False), dict(separators=(u',', u':')),
+                        dict(escape_char=u''), dict(engine='preconvert')):
+            serialiser = jsonte.JsonteSerialiser(**options)
+            for codec in (serialiser.compile(self.schema), serialiser.compile(sample_row=self.rows[0])):
+                self.assertEqual(codec.dumps(self.rows), serialiser.dumps(self.rows), 'differs with %r' % options)
+        self.assertEqual(self.serialiser.compile(dict(self.schema)).dumps([]), u'[]')
+
+    def test_rows_not_matching(self):
+        class MyDate(datetime.date):
+            pass
+
+        codec = self.serialiser.compile(self.schema)
+        rows = self.rows
+        rows[0] = dict(reversed(list(rows[0].items())))
+        del rows[1][u'id']
+        rows[2][u'other'] = 1
+        rows[3] = list(rows[3].items())
+        rows[4][u'price'] = None
+        rows[5][u'day'] = MyDate(2001, 1, 1)
+        rows[6][u'#score'] = float('nan')
+        rows[7][u'active'] = 1
+        rows[8][u'~note'] = {u'#b': 1}
+        self.assertEqual(codec.dumps(rows), self.serialiser.dumps(rows))
+        for row in rows:
+            self.assertEqual(codec.encode_row(row), self.serialiser.dumps(row))
+        rows[9][u'#score'] = float('inf')
+        self.assertRaises(ValueError, jsonte.JsonteSerialiser(allow_nan=False).compile(self.schema).dumps, rows)
+
+        serialiser = jsonte.JsonteSerialiser(sort_keys=True)
+        codec = serialiser.compile([(u'a', int), (u'b', int)])
+        rows = [{u'a': 1, u'c': 2}, {u'b': 2, u'a': 1}]
+        self.assertEqual(codec.dumps(rows), serialiser.dumps(rows))
+
+    def test_sample_row_any_types(self):
+        row = {u'raw': jsonte.JsonteRaw(u'[1,2]'), u'data': array.array('B', b'ab'), u'id': 1}
+        codec = self.serialiser.compile(sample_row=row)
+        self.assertEqual(codec.encode_row(row), self.serialiser.dumps(row))
+
+    def test_loads(self):
+        codec = self.serialiser.compile(self.schema)
+        self.assertEqual(codec.loads(codec.dumps(self.rows)), self.rows)
+
+    def test_websafety(self):
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        self.assertEqual(serialiser.compile(self.schema).dumps(self.rows), serialiser.dumps(self.rows))
+        self.assertEqual(serialiser.compile(self.schema).dumps(iter(self.rows)), serialiser.dumps(self.rows))
+        serialiser = jsonte.JsonteSerialiser(array_websafety='exception')
+        self.assertRaises(RuntimeError, serialiser.compile(self.schema).dumps, self.rows)
+        self.assertRaises(RuntimeError, serialiser.compile(self.schema).dumps, tuple(self.rows))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.serialiser.compile)
+        self.assertRaises(ValueError, self.serialiser.compile, self.schema, self.rows[0])
+        self.assertRaises(ValueError, self.serialiser.compile, [(u'a', int), (u'a', int)])
+        self.assertRaises(ValueError, self.serialiser.compile, [(u'a', complex)])
+        self.assertRaises(ValueError, jsonte.JsonteSerialiser(indent=2).compile, self.schema)
+
+
+class MyDecimal(decimal.Decimal):
+    pass
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.columns = [u'id', u'name', u'#score', u'active', u'price', u'day', u'when', u'at', u'blob', u'~extra']
+        self.rows = [(i, u'row %d \u00e9' % i, i / 3.0, i % 2 == 0, decimal.Decimal(i).scaleb(-2) if i % 3 else None,
+                      datetime.date(2001, 1, 1 + i % 5), datetime.datetime(2001, 1, 1, i % 24), datetime.time(i % 24),
+                      bytearray(b'x' * i), [{u'#a': i}] if i % 2 else array.array('B', [i]))
+                     for i in range(50)]
+
+    def dumps_dicts(self, serialiser, rows):
+        return serialiser.dumps([dict(zip(self.columns, row)) for row in rows])
+
+    def test_same_as_dumps(self):
+        for options in (dict(), dict(sort_keys=True), dict(ensure_ascii=False), dict(separators=(u',', u':')),
+                        dict(escape_char=u'')):
+            serialiser = jsonte.JsonteSerialiser(**options)
+            for batch_size in (1, 7, 10000):
+                self.assertEqual(serialiser.dumps_table(self.columns, self.rows, batch_size),
+                                 self.dumps_dicts(serialiser, self.rows), 'differs with %r' % options)
+
+    def test_odd_tables(self):
+        rows = self.rows
+        rows[1] = rows[1][:-1]
+        rows[2] = (float('nan'),) + rows[2][1:]
+        rows[3] = (MyDecimal(1),) + rows[3][1:]
+        self.assertEqual(self.serialiser.dumps_table(self.columns, rows, 10), self.dumps_dicts(self.serialiser, rows))
+        self.assertEqual(self.serialiser.dumps_table(self.columns, []), u'[]')
+        self.assertEqual(self.serialiser.dumps_table([], [(), ()]), u'[{}, {}]')
+
+    def test_dump_table(self):
+        fp = StringIO()
+        self.serialiser.dump_table(self.columns, iter(self.rows), fp, batch_size=7)
+        self.assertEqual(fp.getvalue(), self.dumps_dicts(self.serialiser, self.rows))
+        self.assertEqual(self.serialiser.loads(fp.getvalue()), [dict(zip(self.columns, row)) for row in self.rows])
+
+    def test_websafety(self):
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        self.assertEqual(serialiser.dumps_table(self.columns, self.rows), self.dumps_dicts(serialiser, self.rows))
+        serialiser = jsonte.JsonteSerialiser(array_websafety='exception')
+        for dump_table in (serialiser.dumps_table,
+                           lambda columns, rows: serialiser.dump_table(columns, rows, StringIO())):
+            rows = iter(self.rows)
+            self.assertRaises(RuntimeError, dump_table, self.columns, rows)
+            self.assertEqual(list(rows), self.rows)  # before any rows are converted
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.serialiser.dumps_table, [u'a', u'a'], [(1, 2)])
+        self.assertRaises(ValueError, jsonte.JsonteSerialiser(indent=1).dumps_table, self.columns, self.rows)
+        self.assertRaises(TypeError, self.serialiser.dumps_table, [u'a'], [(object(),)])
+
+
+class _Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def _point_serialiser(point):
+    dct = jsonte.SerialisationDict()
+    dct[u'#point'] = [point.x, {u'#y': point.y}]  # the inner dict needs escaping, the outer doesn't
+    return dct
+
+
+class EngineConformanceMixin(object):
+    """ Checks that dumps with the engine gives exactly the same output as the Python encoder used by dump """
+    engine = None
+
+    options = [dict(), dict(sort_keys=True), dict(ensure_ascii=False), dict(separators=(u',', u':')),
+               dict(indent=2), dict(escape_char=u''), dict(skipkeys=True),
+               dict(escape_char=u'\u00ac', reserved_initial_chars=u'#\u00a7'),
+               dict(escape_char=u'\u00ac', reserved_initial_chars=u'#\u00a7', ensure_ascii=False)]
+
+    def make_serialiser(self, **options):
+        serialiser = jsonte.JsonteSerialiser(engine=self.engine, **options)
+        serialiser.add_type_serialiser(_Point, _point_serialiser)
+        serialiser.finalise_serialisers()
+        return serialiser
+
+    def assertConforms(self, data):
+        for options in self.options:
+            serialiser = self.make_serialiser(**options)
+            fp = StringIO()
+            serialiser.dump(data, fp)
+            self.assertEqual(serialiser.dumps(data), fp.getvalue(), 'differs with %r' % options)
+
+    def test_plain(self):
+        self.assertConforms({u'a': [1, 2.5, -3, None, True, False, u'text', u'\u00e9\u4e2d\U0001f600'],
+                             u'b': {u'c': {u'd': []}, u'e': {}}, u'f': (1, (2, 3)), u'g': 2 ** 70})
+        self.assertConforms([u'#a', u'{"#b": 1}', u'~'])
+
+    def test_escaped_keys(self):
+        self.assertConforms({u'#a': [{u'#num': 1, u'b': {u'~c': 2}}], u'~#d': {u'#e': 3}, u'': 4, u'*f': 5})
+
+    def test_non_ascii_escape_chars(self):
+        self.assertConforms({u'\u00aca': 1, u'\u00a7b': [{u'\u00ac': 2, u'c\u00ac': 3}], u'#d': u'\u00ace'})
+        for ensure_ascii in (True, False):
+            serialiser = self.make_serialiser(escape_char=u'\u00ac', reserved_initial_chars=u'#\u00a7',
+                                              ensure_ascii=ensure_ascii)
+            data = {u'\u00aca': 1, u'b': {u'\u00a7c': decimal.Decimal('1.5')}}
+            self.assertEqual(serialiser.loads(serialiser.dumps(data)), data)
+
+    def test_non_string_keys(self):
+        self.assertConforms({1: u'a', 2.5: u'b', -3: u'c'})
+        serialiser = self.make_serialiser()
+        self.assertEqual(serialiser.dumps({None: 1, False: 2}), u'{"null": 1, "false": 2}')
+
+    def test_registered_types(self):
+        self.assertConforms({u'#when': [datetime.datetime(2001, 2, 3, 4, 5, 6, 7), datetime.date(2001, 2, 3),
+                                        datetime.time(4, 5, 6),
+                                        datetime.datetime(2001, 2, 3, tzinfo=dateutil.tz.tzutc())],
+                             u'numbers': [decimal.Decimal('1.10'), decimal.Decimal('-1E+5')],
+                             u'binary': [bytearray(b'\x00\x01'), memoryview(b'abc'), array.array('B', b'def')],
+                             u'points': [_Point(1, decimal.Decimal('2')), _Point(_Point(3, 4), {u'#z': None})]})
+        self.assertConforms(decimal.Decimal('1'))
+        self.assertConforms(jsonte.SerialisationDict({u'#num': u'1'}))
+
+    def test_floats(self):
+        self.assertConforms([0.1, 1e16, -1e-7, 1.0, float('nan'), float('inf'), -float('inf')])
+        serialiser = self.make_serialiser(allow_nan=False)
+        self.assertRaises(ValueError, serialiser.dumps, [float('nan')])
+
+    def test_errors(self):
+        serialiser = self.make_serialiser()
+        data = {u'#a': []}
+        data[u'#a'].append(data)
+        self.assertRaises(ValueError, serialiser.dumps, data)
+        shared = [1]
+        self.assertEqual(serialiser.dumps([shared, shared]), u'[[1], [1]]')  # repeated isn't circular
+        self.assertRaises(TypeError, serialiser.dumps, {u'a': object()})
+        self.assertRaises(TypeError, serialiser.dumps, {(1, 2): u'a'})
+        self.assertEqual(self.make_serialiser(skipkeys=True).dumps({(1, 2): u'a', u'#b': 1}), u'{"~#b": 1}')
+
+    def test_file_source(self):
+        serialiser = self.make_serialiser()
+        serialiser.add_type_serialiser(_ZerosFile, jsonte.binary_serialiser)
+        serialiser.finalise_serialisers()
+        self.assertEqual(serialiser.dumps({u'#a': [_ZerosFile(1000)]}), serialiser.dumps({u'#a': [bytearray(1000)]}))
+
+    def test_round_trip(self):
+        serialiser = self.make_serialiser()
+        data = {u'#a': [{u'~b': decimal.Decimal('1.5')}], u'c': datetime.date(2001, 1, 1), u'd': bytearray(b'xyz')}
+        self.assertEqual(serialiser.loads(serialiser.dumps(data)), data)
+
+
+class TestJsonEngine(EngineConformanceMixin, unittest.TestCase):
+    engine = 'json'
+
+
+class TestPreconvertEngine(EngineConformanceMixin, unittest.TestCase):
+    engine = 'preconvert'
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, jsonte.JsonteSerialiser, engine='unknown')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_jsonte_async
+----------------------------------
+
+Tests for `jsonte_async` module.
+
+The loopback test writes a document of JSONTE_ASYNC_TEST_MB megabytes (default 20), so set it to 200 to check the
+event loop lag while writing a 200 MB response.
+"""
+
+import asyncio
+import datetime
+import decimal
+import os
+import time
+import unittest
+
+import jsonte
+import jsonte_async
+
+
+class _LagMonitor(object):
+    """ Measures how late a task sleeping for interval at a time is woken, ie how long the event loop was blocked """
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.ticks = 0
+        self.max_lag = 0.0
+        self._running = True
+
+    async def run(self):
+        while self._running:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.interval)
+            self.ticks += 1
+
+    def stop(self):
+        self._running = False
+
+
+class _ListReader(object):
+    """ Minimal stream reader returning the given pieces """
+    def __init__(self, pieces):
+        self._pieces = list(pieces)
+
+    async def read(self, n=-1):
+        return self._pieces.pop(0) if self._pieces else b''
+
+
+class _ListWriter(object):
+    def __init__(self):
+        self.pieces = list()
+        self.drains = 0
+
+    def write(self, data):
+        self.pieces.append(data)
+
+    async def drain(self):
+        self.drains += 1
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.serialiser = jsonte.JsonteSerialiser()
+        self.data = {u'#rows': [{u'id': i, u'day': datetime.date(2001, 1, 1), u'cost': decimal.Decimal(i),
+                                 u'name': u'caf\xe9 %d' % i} for i in range(1000)]}
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_dump_async(self):
+        writer = _ListWriter()
+        self.loop.run_until_complete(self.serialiser.dump_async(self.data, writer, chunk_size=1000))
+        self.assertTrue(len(writer.pieces) > 10)
+        self.assertEqual(writer.drains, len(writer.pieces))
+        self.assertEqual(b''.join(writer.pieces).decode('utf-8'), self.serialiser.dumps(self.data))
+
+    def test_module_functions(self):
+        writer = _ListWriter()
+        self.loop.run_until_complete(jsonte_async.dump_async(self.serialiser, self.data, writer))
+        self.assertEqual(b''.join(writer.pieces).decode('utf-8'), self.serialiser.dumps(self.data))
+
+    def test_websafety(self):
+        serialiser = jsonte.JsonteSerialiser(array_websafety='prefix')
+        writer = _ListWriter()
+        self.loop.run_until_complete(serialiser.dump_async([1, 2], writer))
+        self.assertEqual(b''.join(writer.pieces).decode('utf-8'), serialiser.dumps([1, 2]))
+        serialiser = jsonte.JsonteSerialiser(array_websafety='exception')
+        self.assertRaises(RuntimeError, self.loop.run_until_complete, serialiser.dump_async([1, 2], writer))
+
+    def test_load_async(self):
+        text = self.serialiser.dumps(self.data).encode('utf-8')
+        # pieces split within a multibyte character
+        reader = _ListReader(text[i:i + 7] for i in range(0, len(text), 7))
+        self.assertEqual(self.loop.run_until_complete(self.serialiser.load_async(reader)), self.data)
+
+    def test_iterload_async(self):
+        text = self.serialiser.dumps(self.data).encode('utf-8')
+
+        async def collect(reader):
+            return [item async for item in self.serialiser.iterload_async(reader, path=[u'#rows'])]
+
+        items = self.loop.run_until_complete(collect(_ListReader(text[i:i + 100] for i in range(0, len(text), 100))))
+        self.assertEqual(items, self.data[u'#rows'])
+        self.assertRaises(ValueError, self.loop.run_until_complete, collect(_ListReader([text[:-50]])))
+
+    def test_loopback_lag(self):
+        size = float(os.environ.get('JSONTE_ASYNC_TEST_MB', 20)) * 1e6
+        row = {u'id': 1, u'day': datetime.date(2001, 1, 1), u'cost': decimal.Decimal('12.50'), u'name': u'x' * 50}
+        row_size = len(self.serialiser.dumps(row)) + 2
+        rows = [row] * int(size / row_size)
+        monitor = _LagMonitor()
+
+        async def handle(reader, writer):
+            await self.serialiser.dump_async(rows, writer)
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            monitor_task = asyncio.ensure_future(monitor.run())
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            count = 0
+            start = time.perf_counter()
+            async for item in self.serialiser.iterload_async(reader):
+                if count == 0:
+                    self.assertEqual(item, row)
+                count += 1
+            elapsed = time.perf_counter() - start
+            writer.close()
+            monitor.stop()
+            await monitor_task
+            server.close()
+            await server.wait_closed()
+            return count, elapsed
+
+        count, elapsed = self.loop.run_until_complete(run())
+        self.assertEqual(count, len(rows))
+        # the monitor should have run throughout, rather than just before and after the document was written
+        self.assertTrue(monitor.ticks > 20, monitor.ticks)
+        self.assertTrue(monitor.max_lag < elapsed / 10, (monitor.max_lag, elapsed))
+
+
+if __name__ == '__main__':
+    unittest.main()